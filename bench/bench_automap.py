@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks the automap strategies against synthetic discs.
+
+Each scenario builds a synthetic disc and season, then times every mapping
+strategy (calculate, the title, longest-title chapter, and all-title chapter
+algorithms, and the full automap fallback chain) reporting the best wall time,
+peak memory and number of solutions of each. Results can be saved as JSON and
+compared against a previous run, in which case the script exits with a non-zero
+status if any strategy slowed down by more than the permitted ratio.
+"""
+
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import datetime as dt
+
+from synthetic import SyntheticDisc, layout, episodes
+
+from tvrip.episodemap import EpisodeMap, MapError, calculate
+
+
+MINUTES = dt.timedelta(minutes=1)
+
+# name: (episode-count, chapters-per-episode, duration-range, layout options)
+SCENARIOS = {
+    'titles-6x6': (6, 6, (40, 50), {}),
+    'titles-26x8-extras': (26, 8, (20, 25), {'extras': 8}),
+    'titles-13x6-duplicates': (13, 6, (40, 50), {'duplicates': 4}),
+    'titles-8x6-multipart': (8, 6, (40, 50), {'multipart': 2}),
+    'chapters-4x6': (4, 6, (40, 50), {'single_title': True}),
+    'chapters-6x8': (6, 8, (20, 30), {'single_title': True}),
+    'chapters-8x10': (8, 10, (20, 30), {'single_title': True}),
+    'chapters-10x8': (10, 8, (20, 30), {'single_title': True}),
+    }
+
+
+def strategies(disc, season, duration_min, duration_max):
+    """
+    Returns the mapping strategies to run against *disc*.
+
+    Each strategy returns the number of solutions it found (a strategy which
+    finds a unique mapping without consulting its chooser counts as one).
+    """
+    chapters = [chapter for title in disc.titles for chapter in title.chapters]
+    longest = max(disc.titles, key=lambda title: title.duration)
+    found = []
+
+    def choose_first(mappings):
+        found.append(len(mappings))
+        return mappings[0]
+
+    def solutions(mapping):
+        return found.pop() if found else int(bool(mapping))
+
+    def run_calculate():
+        return len(calculate(chapters, season, duration_min, duration_max))
+
+    def run_calculate_longest():
+        return len(calculate(
+            longest.chapters, season, duration_min, duration_max))
+
+    def run_titles():
+        return solutions(EpisodeMap()._automap_titles(
+            disc.titles, season, duration_min, duration_max))
+
+    def run_chapters_longest():
+        return solutions(EpisodeMap()._automap_chapters_longest(
+            disc.titles, season, duration_min, duration_max,
+            choose_mapping=choose_first))
+
+    def run_chapters_all():
+        return solutions(EpisodeMap()._automap_chapters_all(
+            disc.titles, season, duration_min, duration_max,
+            choose_mapping=choose_first))
+
+    def run_automap():
+        mapping = EpisodeMap()
+        mapping.automap(
+            disc.titles, season, duration_min, duration_max,
+            choose_mapping=choose_first)
+        return solutions(mapping)
+
+    return {
+        'calculate': run_calculate,
+        'calculate_longest': run_calculate_longest,
+        'titles': run_titles,
+        'chapters_longest': run_chapters_longest,
+        'chapters_all': run_chapters_all,
+        'automap': run_automap,
+        }
+
+
+def measure(func, repeat):
+    "Returns the best wall time, peak memory, and result of *func*"
+    best = None
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = func()
+        except MapError as exc:
+            result = exc.__class__.__name__
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    try:
+        func()
+    except MapError:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def run(names, repeat):
+    results = {}
+    for name in names:
+        count, chapters, (low, high), options = SCENARIOS[name]
+        duration_min, duration_max = low * MINUTES, high * MINUTES
+        disc = SyntheticDisc(layout(
+            count, chapters, duration_min, duration_max, **options))
+        season = episodes(count, multipart=options.get('multipart', 0))
+        for strategy, func in strategies(
+                disc, season, duration_min, duration_max).items():
+            elapsed, peak, result = measure(func, repeat)
+            results['{}/{}'.format(name, strategy)] = {
+                'time': elapsed,
+                'peak_memory': peak,
+                'solutions': result,
+                }
+            print('{name:<40s} {time:10.6f}s {peak:10d}B {result!s:>24s}'.format(
+                name='{}/{}'.format(name, strategy), time=elapsed,
+                peak=peak, result=result))
+    return results
+
+
+def compare(results, baseline, ratio):
+    "Prints and returns the benchmarks which are *ratio* times slower"
+    regressions = []
+    for name, result in sorted(results.items()):
+        try:
+            before = baseline[name]['time']
+        except KeyError:
+            continue
+        # Ignore differences in the noise of very quick runs
+        if result['time'] > before * ratio and result['time'] > 0.001:
+            regressions.append(name)
+            print('REGRESSION {name}: {before:.6f}s -> {after:.6f}s'.format(
+                name=name, before=before, after=result['time']))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        'scenarios', nargs='*', default=sorted(SCENARIOS),
+        help='The scenarios to run (default: all of %(default)s)')
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=3,
+        help='The number of times to run each strategy (default: %(default)s)')
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help='Save the results as JSON to the specified file')
+    parser.add_argument(
+        '-b', '--baseline', metavar='FILE',
+        help='Compare the results to those saved in the specified file')
+    parser.add_argument(
+        '--ratio', type=float, default=1.5,
+        help='The slow-down which counts as a regression (default: %(default)s)')
+    args = parser.parse_args(args)
+    results = run(args.scenarios, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(results, json.load(f), args.ratio):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks the scan, map and rip pipeline against the simulated toolchain.
+
+The tvrip command interpreter is driven through the scan, automap and rip
+commands for each scenario with its utility paths pointing at the simulated
+HandBrakeCLI, AtomicParsley and vlc in sim/ (see simtools for the environment
+variables which control them). Each scenario's source is a scan log standing
+in for a disc. The wall time of each stage, the number of episodes ripped and
+the throughput (in episodes per minute) are reported. The database, target
+and temporary directories are all created under a temporary HOME which is
+removed afterward.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import datetime as dt
+from collections import deque
+
+from scanlog import generate
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MINUTE = dt.timedelta(minutes=1)
+
+# name: (scan log or generate() arguments, episodes, duration range)
+SCENARIOS = {
+    'pal-episodes-extras': ('pal-episodes-extras.log', 4, (40, 50)),
+    'ntsc-single-title': ('ntsc-single-title.log', 4, (40, 48)),
+    'play-all': ('play-all.log', 3, (20, 25)),
+    'synthetic-12': ((12, 6, 2, 2), 12, (20, 50)),
+    'synthetic-26': ((26, 8, 4, 4), 26, (20, 50)),
+    }
+
+
+def make_cmd(home, verbose):
+    """
+    Returns a command interpreter using a database under *home*.
+
+    The tvrip modules are imported here (after HOME has been redirected) as
+    the data directory is determined at import time.
+    """
+    os.environ['HOME'] = home
+    sys.path.insert(0, os.path.join(HERE, '..'))
+    from tvrip.ripcmd import RipCmd
+
+    class BenchCmd(RipCmd):
+        "A RipCmd which answers its prompts from a script"
+
+        def __init__(self):
+            super().__init__()
+            self.answers = deque()
+            if not verbose:
+                self.stdout = io.StringIO()
+
+        def input(self, prompt=''):
+            return self.answers.popleft()
+
+        def choose_mapping(self, mappings):
+            return mappings[0]
+
+    return BenchCmd()
+
+
+def run(cmd, home, names):
+    results = {}
+    sim = os.path.join(HERE, 'sim')
+    target = os.path.join(home, 'Videos')
+    temp = os.path.join(home, 'tmp')
+    os.mkdir(target)
+    os.mkdir(temp)
+    for line in (
+            'path handbrake ' + os.path.join(sim, 'HandBrakeCLI'),
+            'path atomicparsley ' + os.path.join(sim, 'AtomicParsley'),
+            'path vlc ' + os.path.join(sim, 'vlc'),
+            'path remux ' + os.path.join(sim, 'ffmpeg'),
+            'target ' + target,
+            'temp ' + temp,
+            ):
+        cmd.onecmd(line)
+    for name in names:
+        source, count, (low, high) = SCENARIOS[name]
+        if isinstance(source, tuple):
+            filename = os.path.join(home, name + '.log')
+            with open(filename, 'w') as f:
+                f.write(generate(
+                    *source, duration_min=low * MINUTE,
+                    duration_max=high * MINUTE, seed=len(results)))
+            source = filename
+        else:
+            source = os.path.join(HERE, 'scans', source)
+        cmd.answers.extend(
+            ['1', str(count)] +
+            ['Episode {}'.format(number) for number in range(1, count + 1)])
+        for line in (
+                'program ' + name,
+                'duration {}-{}'.format(low, high),
+                'source ' + source,
+                ):
+            cmd.onecmd(line)
+        result = {}
+        for stage in ('scan', 'automap', 'rip'):
+            start = time.perf_counter()
+            cmd.onecmd(stage)
+            result[stage] = time.perf_counter() - start
+        result['time'] = sum(result.values())
+        result['episodes'] = sum(
+            1 for episode in cmd.config.season.episodes if episode.ripped)
+        result['episodes_per_minute'] = 60 * result['episodes'] / result['time']
+        results[name] = result
+        print(
+            '{name:<24s} scan {scan:8.3f}s automap {automap:8.3f}s '
+            'rip {rip:8.3f}s {episodes:3d} episodes '
+            '{episodes_per_minute:8.1f}/min'.format(name=name, **result))
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        'scenarios', nargs='*', default=sorted(SCENARIOS),
+        help='The scenarios to run (default: all of %(default)s)')
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='Show the output of tvrip and the simulated tools')
+    parser.add_argument(
+        '-s', '--speed', type=float, default=20000,
+        help='The simulated encoding speed as a multiple of real-time '
+        '(default: %(default)s)')
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help='Save the results as JSON to the specified file')
+    parser.add_argument(
+        '-b', '--baseline', metavar='FILE',
+        help='Compare the results to those saved in the specified file')
+    parser.add_argument(
+        '--ratio', type=float, default=1.5,
+        help='The slow-down which counts as a regression (default: %(default)s)')
+    args = parser.parse_args(args)
+    os.environ['TVRIP_SIM_SPEED'] = str(args.speed)
+    if not args.verbose:
+        os.environ.setdefault('TVRIP_SIM_QUIET', '1')
+    home = tempfile.mkdtemp(prefix='tvrip-bench-')
+    try:
+        results = run(make_cmd(home, args.verbose), home, args.scenarios)
+    finally:
+        shutil.rmtree(home)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if args.baseline:
+        # Imported late as bench_automap imports tvrip, which must not happen
+        # before HOME is redirected
+        from bench_automap import compare
+        with open(args.baseline) as f:
+            if compare(results, json.load(f), args.ratio):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
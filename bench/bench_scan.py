@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks the HandBrake scan parser without a drive.
+
+The scan logs in the scans/ directory, and synthetic logs of increasing size,
+are parsed with Disc.from_output. For each, the best parsing rate (in lines per
+second) and the number of titles, chapters, and audio and subtitle tracks
+found are reported. Results can be saved and compared with a baseline in the
+same manner as bench_automap.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+from scanlog import generate
+from bench_automap import compare
+
+from tvrip.ripper import Disc
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (titles, chapters, audio tracks, subtitle tracks)
+SYNTHETIC = {
+    'synthetic-4x6': (4, 6, 2, 2),
+    'synthetic-30x12': (30, 12, 4, 6),
+    'synthetic-99x30': (99, 30, 6, 6),
+    'synthetic-99x99-tracks': (99, 99, 8, 32),
+    }
+
+
+def corpus():
+    "Returns a dict mapping names to the content of the recorded scan logs"
+    result = {}
+    for filename in sorted(glob.glob(os.path.join(HERE, 'scans', '*.log'))):
+        with open(filename, encoding='utf-8', errors='replace') as f:
+            result[os.path.basename(filename)] = f.read()
+    return result
+
+
+def counts(disc):
+    "Returns the number of objects of each type the parser produced"
+    return {
+        'titles': len(disc.titles),
+        'chapters': sum(len(title.chapters) for title in disc.titles),
+        'audio_tracks': sum(len(title.audio_tracks) for title in disc.titles),
+        'subtitle_tracks': sum(
+            len(title.subtitle_tracks) for title in disc.titles),
+        }
+
+
+def measure(output, repeat):
+    "Returns the best time taken to parse *output*, and the resulting disc"
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        disc = Disc.from_output([output])
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, disc
+
+
+def run(logs, repeat):
+    results = {}
+    for name, output in logs.items():
+        lines = output.count('\n')
+        elapsed, disc = measure(output, repeat)
+        result = {
+            'time': elapsed,
+            'lines': lines,
+            'lines_per_second': lines / elapsed,
+            }
+        result.update(counts(disc))
+        results[name] = result
+        print(
+            '{name:<28s} {lines:7d} lines {rate:12.0f} lines/s '
+            '{titles:3d} titles {chapters:5d} chapters {audio_tracks:5d} '
+            'audio {subtitle_tracks:5d} subtitles'.format(
+                name=name, rate=result['lines_per_second'], **result))
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5,
+        help='The number of times to parse each log (default: %(default)s)')
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help='Save the results as JSON to the specified file')
+    parser.add_argument(
+        '-b', '--baseline', metavar='FILE',
+        help='Compare the results to those saved in the specified file')
+    parser.add_argument(
+        '--ratio', type=float, default=1.5,
+        help='The slow-down which counts as a regression (default: %(default)s)')
+    args = parser.parse_args(args)
+    logs = corpus()
+    logs.update(
+        (name, generate(*params, seed=index))
+        for index, (name, params) in enumerate(sorted(SYNTHETIC.items()))
+        )
+    results = run(logs, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(results, json.load(f), args.ratio):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A generator of synthetic HandBrakeCLI scan logs.
+
+The output mimics that of "HandBrakeCLI --scan" (including the libdvdnav
+chatter and progress lines which the parser must skip) for a disc of the
+requested number of titles, chapters, and audio and subtitle tracks.
+"""
+
+import random
+import datetime as dt
+
+
+AUDIO_TRACKS = [
+    ('English', 'AC3', '5.1 ch', 'eng', 448000),
+    ('English', 'AC3', '2.0 ch', 'eng', 192000),
+    ('Francais', 'AC3', '2.0 ch', 'fra', 192000),
+    ('Deutsch', 'DTS', '5.1 ch', 'deu', 768000),
+    ('Espanol', 'AC3', '2.0 ch', 'spa', 192000),
+    ('Japanese', 'AC3', '2.0 ch', 'jpn', 192000),
+    ]
+
+SUBTITLE_TRACKS = [
+    ('English', 'eng'),
+    ('English Closed Captions', 'eng'),
+    ('Francais', 'fra'),
+    ('Deutsch', 'deu'),
+    ('Espanol', 'spa'),
+    ('Nederlands', 'nld'),
+    ]
+
+# DVDs are read at roughly 300 2KB blocks per second of video
+BLOCKS_PER_SECOND = 300
+
+
+def timestamp(seconds):
+    "Formats *seconds* as HandBrake's HH:MM:SS duration"
+    return '{:02d}:{:02d}:{:02d}'.format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def generate(titles=4, chapters=6, audio_tracks=2, subtitle_tracks=2, *,
+             duration_min=dt.timedelta(minutes=20),
+             duration_max=dt.timedelta(minutes=50),
+             name='SYNTHETIC_DISC', serial='0123456789abcdef', seed=0):
+    "Returns the text of a scan log for a synthetic disc"
+    rand = random.Random(seed)
+    low = int(duration_min.total_seconds())
+    high = int(duration_max.total_seconds())
+    lines = [
+        '[00:00:00] hb_init: starting libhb thread',
+        'HandBrake 0.10.5 (2016021100) - Linux x86_64 - http://handbrake.fr',
+        '[00:00:00] hb_scan: path=/dev/dvd, title_index=0',
+        'libdvdnav: Using dvdnav version 5.0.3',
+        'libdvdread: Encrypted DVD support unavailable.',
+        'libdvdnav: DVD Title: {}'.format(name),
+        'libdvdnav: DVD Serial Number: {}'.format(serial),
+        'libdvdnav: DVD Title (Alternative): ',
+        '[00:00:01] scan: DVD has {} title(s)'.format(titles),
+        ]
+    cell = 0
+    for number in range(1, titles + 1):
+        durations = []
+        remaining = rand.randint(low, high)
+        for chapter in range(chapters - 1):
+            duration = rand.randint(1, max(1, remaining // (chapters - chapter)))
+            durations.append(duration)
+            remaining -= duration
+        durations.append(max(1, remaining))
+        lines.extend([
+            '[00:00:01] scan: scanning title {}'.format(number),
+            '[00:00:01] scan: decoding previews for title {}'.format(number),
+            'Scanning title {} of {}, preview 10, 100.00 %'.format(
+                number, titles),
+            '+ title {}:'.format(number),
+            '  + vts {vts}, ttn 1, cells {first}->{last} ({blocks} blocks)'.format(
+                vts=number, first=cell, last=cell + chapters - 1,
+                blocks=sum(durations) * BLOCKS_PER_SECOND),
+            '  + duration: {}'.format(timestamp(sum(durations))),
+            '  + size: 720x576, aspect: 1.78, 25.000 fps',
+            '  + autocrop: 0/0/8/8',
+            '  + chapters:',
+            ])
+        lines.extend(
+            '    + {number}: cells {cell}->{cell}, {blocks} blocks, '
+            'duration {duration}'.format(
+                number=chapter, cell=cell + chapter - 1,
+                blocks=duration * BLOCKS_PER_SECOND,
+                duration=timestamp(duration))
+            for chapter, duration in enumerate(durations, start=1)
+            )
+        cell += chapters
+        lines.append('  + audio tracks:')
+        lines.extend(
+            '    + {number}, {name} ({encoding}) ({mix}) (iso639-2: {lang}), '
+            '48000Hz, {rate}bps'.format(
+                number=track, name=name, encoding=encoding, mix=mix,
+                lang=lang, rate=rate)
+            for track, (name, encoding, mix, lang, rate) in enumerate(
+                (AUDIO_TRACKS * audio_tracks)[:audio_tracks], start=1)
+            )
+        lines.append('  + subtitle tracks:')
+        lines.extend(
+            '    + {number}, {name} (iso639-2: {lang}) (Bitmap) (VOBSUB)'.format(
+                number=track, name=name, lang=lang)
+            for track, (name, lang) in enumerate(
+                (SUBTITLE_TRACKS * subtitle_tracks)[:subtitle_tracks], start=1)
+            )
+    lines.append('HandBrake has exited.')
+    return '\n'.join(lines) + '\n'
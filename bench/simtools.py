@@ -0,0 +1,297 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Simulated implementations of the external utilities used by tvrip.
+
+The executables in the sim/ directory call the functions in this module in
+place of HandBrakeCLI, ffmpeg, AtomicParsley and vlc. The simulated HandBrakeCLI
+treats its input (the -i option) as a scan log (see scanlog and the scans/
+directory) which stands in for the disc: scans print the log (filtered by the
+requested title and minimum duration), while encodes print progress, take a
+time proportional to the duration of the selected title or chapters, and
+write a dummy MP4. The simulated ffmpeg remuxes in the same manner (faster,
+but with larger output). The simulated AtomicParsley copies its input to its output
+and the simulated vlc simply exits.
+
+The behaviour of the tools can be adjusted with the following environment
+variables:
+
+TVRIP_SIM_SPEED
+    The encoding speed as a multiple of real-time (default: 500); 0 disables
+    the delay entirely
+
+TVRIP_SIM_BITRATE
+    The number of bytes written to the dummy MP4 per second of video (default:
+    1000); the files are sparse so large values cost little disk
+
+TVRIP_SIM_SCAN_DELAY
+    The number of seconds to spend scanning each title (default: 0)
+
+TVRIP_SIM_TAG_DELAY
+    The number of seconds to spend tagging each file (default: 0)
+
+TVRIP_SIM_QUIET
+    If 1, suppress the encoding progress and tagging output (default: 0)
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import struct
+
+
+title_re = re.compile(r'^\+ title (?P<number>\d+):$')
+duration_re = re.compile(
+    r'^  \+ duration: (?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+)$')
+stats_re = re.compile(r'^  \+ size: .*, (?P<frame_rate>[0-9.]+) fps$')
+chapter_re = re.compile(
+    r'^    \+ (?P<number>\d+): cells .*, '
+    r'duration (?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+)$')
+progress_re = re.compile(r'^(Scanning title|\[\d\d:\d\d:\d\d\] scan:)')
+
+PRESETS = [
+    'ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow',
+    'slower', 'veryslow', 'placebo',
+    ]
+
+
+def setting(name, default):
+    "Returns the value of the simulation setting *name*"
+    return type(default)(os.environ.get('TVRIP_SIM_' + name, default))
+
+
+def seconds(match):
+    "Returns the number of seconds in a duration *match*"
+    return (
+        int(match.group('hours')) * 3600 +
+        int(match.group('minutes')) * 60 +
+        int(match.group('seconds')))
+
+
+class Title():
+    "A title section of a scan log"
+
+    def __init__(self, number):
+        self.number = number
+        self.lines = []
+        self.duration = 0
+        self.frame_rate = 25.0
+        self.chapters = {}
+
+    def add(self, line):
+        self.lines.append(line)
+        match = duration_re.match(line)
+        if match:
+            self.duration = seconds(match)
+        match = stats_re.match(line)
+        if match:
+            self.frame_rate = float(match.group('frame_rate'))
+        match = chapter_re.match(line)
+        if match:
+            self.chapters[int(match.group('number'))] = seconds(match)
+
+
+def load(source):
+    """
+    Splits the scan log *source* into its preamble, its titles and its
+    trailer.
+    """
+    preamble = []
+    titles = []
+    trailer = []
+    with open(source, encoding='utf-8', errors='replace') as f:
+        for line in f.read().splitlines():
+            match = title_re.match(line)
+            if match:
+                titles.append(Title(int(match.group('number'))))
+            if line == 'HandBrake has exited.':
+                trailer.append(line)
+            elif progress_re.match(line):
+                # Progress chatter is regenerated per title scanned
+                pass
+            elif titles:
+                titles[-1].add(line)
+            else:
+                preamble.append(line)
+    return preamble, titles, trailer
+
+
+def option(args, name, default=None):
+    "Returns the value following *name* in *args*"
+    try:
+        return args[args.index(name) + 1]
+    except (ValueError, IndexError):
+        return default
+
+
+def dummy_mp4(filename, duration):
+    """
+    Writes a (sparse) dummy MP4 of *duration* seconds to *filename*.
+
+    The file consists of an ftyp box followed by an mdat box of the size
+    implied by TVRIP_SIM_BITRATE.
+    """
+    size = int(duration * setting('BITRATE', 1000))
+    ftyp = b'isom\x00\x00\x02\x00isomiso2avc1mp41'
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('>I4s', len(ftyp) + 8, b'ftyp') + ftyp)
+        f.write(struct.pack('>I4s', size + 8, b'mdat'))
+        f.truncate(f.tell() + size)
+
+
+def handbrake(args):
+    "Simulates HandBrakeCLI"
+    source = option(args, '-i')
+    if not source or not os.path.isfile(source):
+        print("libdvdread: Can't open {} for reading".format(source))
+        print('libdvdnav: vm: failed to open/read the DVD')
+        return 0 if '--scan' in args else 3
+    preamble, titles, trailer = load(source)
+    number = int(option(args, '-t', 1))
+    if '--scan' in args:
+        min_duration = int(option(args, '--min-duration', 10))
+        if number:
+            titles = [title for title in titles if title.number == number]
+        for line in preamble:
+            print(line)
+        for title in titles:
+            print('[00:00:01] scan: scanning title {}'.format(title.number))
+            time.sleep(setting('SCAN_DELAY', 0.0))
+            if title.duration >= min_duration:
+                print('+ title {}:'.format(title.number))
+                for line in title.lines[1:]:
+                    print(line)
+            else:
+                print('[00:00:01] scan: ignoring title (too short)')
+        for line in trailer:
+            print(line)
+        return 0
+    try:
+        title = [title for title in titles if title.number == number][0]
+    except IndexError:
+        print('Invalid title number {}'.format(number), file=sys.stderr)
+        return 3
+    chapters = option(args, '-c')
+    if chapters:
+        start, _, finish = chapters.partition('-')
+        start = int(start)
+        finish = int(finish or start)
+        duration = sum(
+            length for chapter, length in title.chapters.items()
+            if start <= chapter <= finish)
+    else:
+        duration = title.duration
+    start_at = option(args, '--start-at')
+    if start_at:
+        duration = max(0, duration - int(start_at.split(':', 1)[1]))
+    stop_at = option(args, '--stop-at')
+    if stop_at:
+        duration = min(duration, int(stop_at.split(':', 1)[1]))
+    # Faster presets encode more quickly but produce larger files
+    try:
+        faster = PRESETS.index(option(args, '--encoder-preset', 'medium'))
+    except ValueError:
+        print('Invalid preset', file=sys.stderr)
+        return 3
+    faster = PRESETS.index('medium') - faster
+    speed = setting('SPEED', 500.0) * 1.5 ** faster
+    quiet = setting('QUIET', 0)
+    if speed:
+        steps = 10
+        elapsed = duration / speed
+        for step in range(steps):
+            time.sleep(elapsed / steps)
+            if not quiet:
+                sys.stdout.write(
+                    '\rEncoding: task 1 of 1, {percent:.2f} % '
+                    '({fps:.2f} fps, avg {fps:.2f} fps, ETA {eta})'.format(
+                        percent=100 * (step + 1) / steps,
+                        fps=title.frame_rate * speed,
+                        eta=time.strftime('%Hh%Mm%Ss', time.gmtime(
+                            elapsed * (steps - step - 1) / steps))))
+                sys.stdout.flush()
+        if not quiet:
+            sys.stdout.write('\n')
+    dummy_mp4(option(args, '-o'), duration * 1.1 ** faster)
+    if not quiet:
+        print('Encode done!', file=sys.stderr)
+    return 0
+
+
+def ffmpeg(args):
+    "Simulates ffmpeg remuxing a DVD title"
+    source = option(args, '-i')
+    if not source or not os.path.isfile(source):
+        print('{}: No such file or directory'.format(source), file=sys.stderr)
+        return 1
+    preamble, titles, trailer = load(source)
+    number = int(option(args, '-title', 1))
+    try:
+        title = [title for title in titles if title.number == number][0]
+    except IndexError:
+        print('Invalid title number {}'.format(number), file=sys.stderr)
+        return 1
+    start = option(args, '-chapter_start')
+    if start:
+        start = int(start)
+        finish = int(option(args, '-chapter_end', start))
+        duration = sum(
+            length for chapter, length in title.chapters.items()
+            if start <= chapter <= finish)
+    else:
+        duration = title.duration
+    # Stream copies run several times faster than encodes, but the output is
+    # much larger
+    speed = setting('SPEED', 500.0) * 4
+    if speed:
+        time.sleep(duration / speed)
+    dummy_mp4(args[-1], duration * 4)
+    return 0
+
+
+def atomicparsley(args):
+    "Simulates AtomicParsley"
+    source = args[0]
+    target = option(args, '-o')
+    if not os.path.isfile(source):
+        print('AtomicParsley error: can\'t open {} for reading'.format(source))
+        return 1
+    time.sleep(setting('TAG_DELAY', 0.0))
+    shutil.copyfile(source, target)
+    if not setting('QUIET', 0):
+        print('Started writing to temp file.')
+        print(' Progress: 100%')
+        print('Finished writing to temp file.')
+    return 0
+
+
+def vlc(args):
+    "Simulates vlc"
+    return 0
+
+
+def main(tool):
+    return {
+        'HandBrakeCLI': handbrake,
+        'ffmpeg': ffmpeg,
+        'AtomicParsley': atomicparsley,
+        'vlc': vlc,
+        }[tool](sys.argv[1:])
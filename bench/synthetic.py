@@ -0,0 +1,124 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Builders for synthetic discs and episodes.
+
+The functions in this module construct Disc, Title and Chapter structures
+without a drive (or HandBrake), along with transient Episode objects, so that
+the mapping algorithms can be exercised against discs of arbitrary size and
+shape.
+"""
+
+import os
+import sys
+import random
+import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tvrip.ripper import Disc, Title, Chapter
+from tvrip.database import Program, Season, Episode
+
+
+class SyntheticDisc(Disc):
+    """
+    A Disc constructed from a layout rather than a scan.
+
+    The *layout* is a list with an entry for each title; each entry is a list
+    of the chapter durations (as timedeltas) within that title.
+    """
+
+    def __init__(self, layout, source='/dev/null'):
+        self._reset(source)
+        self.name = 'SYNTHETIC'
+        for number, durations in enumerate(layout, start=1):
+            title = Title(self)
+            title.number = number
+            for chapter_number, duration in enumerate(durations, start=1):
+                chapter = Chapter(title)
+                chapter.number = chapter_number
+                chapter.duration = duration
+            title.duration = sum(durations, dt.timedelta())
+        self._finalize()
+
+
+def split(duration, count, rand):
+    "Splits *duration* into *count* chapters of (whole second) random lengths"
+    seconds = int(duration.total_seconds())
+    cuts = sorted(rand.sample(range(1, seconds), count - 1))
+    return [
+        dt.timedelta(seconds=finish - start)
+        for start, finish in zip([0] + cuts, cuts + [seconds])
+        ]
+
+
+def episodes(count, multipart=0, program='Synthetic', season=1):
+    """
+    Returns *count* transient episodes of a synthetic season.
+
+    The first *multipart* episodes are named as the parts of a single
+    multi-part episode.
+    """
+    season = Season(Program(program), season)
+    return [
+        Episode(
+            season, number,
+            'Opener (%d)' % number if number <= multipart else
+            'Episode %d' % number)
+        for number in range(1, count + 1)
+        ]
+
+
+def layout(episodes, chapters, duration_min, duration_max, *,
+           single_title=False, extras=0, duplicates=0, multipart=0, seed=0):
+    """
+    Generates a disc layout for :class:`SyntheticDisc`.
+
+    The layout contains *episodes* episodes (each of *chapters* chapters)
+    with durations within the specified range, and *extras* short titles. If
+    *single_title* is set, the episodes are all placed within one long title
+    (forcing chapter-based mapping), otherwise each episode is a title of its
+    own. The first *multipart* episodes are combined into one title, and the
+    last *duplicates* episode titles are followed by an identical duplicate.
+    """
+    rand = random.Random(seed)
+    low = int(duration_min.total_seconds())
+    high = int(duration_max.total_seconds())
+    runtimes = [
+        dt.timedelta(seconds=rand.randint(low, high))
+        for episode in range(episodes)
+        ]
+    if multipart > 1:
+        runtimes[:multipart] = [sum(runtimes[:multipart], dt.timedelta())]
+    titles = [split(runtime, chapters, rand) for runtime in runtimes]
+    if single_title:
+        titles = [[chapter for title in titles for chapter in title]]
+    elif duplicates:
+        titles = [
+            copy
+            for index, title in enumerate(titles)
+            for copy in (
+                [title, list(title)] if index >= len(titles) - duplicates else
+                [title])
+            ]
+    titles.extend(
+        split(dt.timedelta(minutes=rand.randint(5, 15)), 2, rand)
+        for extra in range(extras)
+        )
+    return titles
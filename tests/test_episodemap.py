@@ -0,0 +1,216 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+import pytest
+
+from tvrip.database import Program, Season, Episode
+from tvrip.ripper import Disc
+from tvrip.episodemap import (
+    EpisodeMap, NoMappingError, MultipleSolutionsError, runtime_window)
+
+
+def minutes(n):
+    return timedelta(minutes=n)
+
+
+def timestamp(seconds):
+    return '{:02d}:{:02d}:{:02d}'.format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def make_disc(*titles):
+    """
+    Returns a Disc parsed from a minimal scan log; each of *titles* is a list
+    of chapter durations in minutes
+    """
+    lines = [
+        'libdvdnav: DVD Title: TEST_DISC',
+        'libdvdnav: DVD Serial Number: 0123456789abcdef',
+        ]
+    cell = 0
+    for number, chapters in enumerate(titles, start=1):
+        lines.extend([
+            '+ title {}:'.format(number),
+            '  + vts {vts}, ttn 1, cells {first}->{last} ({blocks} blocks)'.format(
+                vts=number, first=cell, last=cell + len(chapters) - 1,
+                blocks=sum(chapters) * 18000),
+            '  + duration: {}'.format(timestamp(sum(chapters) * 60)),
+            '  + size: 720x576, aspect: 1.78, 25.000 fps',
+            '  + chapters:',
+            ])
+        lines.extend(
+            '    + {number}: cells {cell}->{cell}, {blocks} blocks, '
+            'duration {duration}'.format(
+                number=chapter, cell=cell + chapter - 1,
+                blocks=duration * 18000, duration=timestamp(duration * 60))
+            for chapter, duration in enumerate(chapters, start=1)
+            )
+        cell += len(chapters)
+        lines.extend(['  + audio tracks:', '  + subtitle tracks:'])
+    lines.append('HandBrake has exited.')
+    return Disc.from_output(['\n'.join(lines) + '\n'])
+
+
+def make_episodes(count):
+    season = Season(Program('Foo'), 1)
+    return [
+        Episode(season, number, 'Episode {}'.format(number))
+        for number in range(1, count + 1)
+        ]
+
+
+def test_runtime_window_too_few_samples():
+    assert runtime_window(
+        [minutes(30), minutes(31)], minutes(20), minutes(50)
+        ) == (minutes(20), minutes(50))
+
+
+def test_runtime_window_narrows():
+    low, high = runtime_window(
+        [minutes(29), minutes(30), minutes(31)], minutes(20), minutes(50))
+    assert minutes(20) < low < minutes(29)
+    assert minutes(31) < high < minutes(50)
+
+
+def test_runtime_window_clamped():
+    assert runtime_window(
+        [minutes(20), minutes(21), minutes(50)], minutes(25), minutes(40)
+        ) == (minutes(25), minutes(40))
+
+
+def test_runtime_window_disjoint():
+    assert runtime_window(
+        [minutes(60), minutes(60), minutes(60)], minutes(20), minutes(50)
+        ) == (minutes(20), minutes(50))
+
+
+def test_automap_no_titles():
+    with pytest.raises(NoMappingError):
+        EpisodeMap().automap([], make_episodes(2), minutes(20), minutes(50))
+
+
+def test_automap_window_keeps_titles():
+    # Title 3 is a long episode outside the historical window; the narrowed
+    # mapping would skip it and shift title 4 onto episode 3
+    disc = make_disc([10, 10, 10], [10, 10, 10], [15, 15, 15], [10, 10, 10])
+    episodes = make_episodes(4)
+    runtimes = [minutes(30)] * 3
+    m = EpisodeMap()
+    m.automap(
+        disc.titles, episodes, minutes(20), minutes(50), runtimes=runtimes)
+    assert [m[e].number for e in episodes] == [1, 2, 3, 4]
+
+
+def test_automap_window_resolves_ambiguity():
+    # A single title of eight chapters which can be split into two episodes
+    # in several ways over the configured range, but only one way within the
+    # historical window
+    disc = make_disc([120], [5, 10, 15, 5, 5, 10, 15, 5])
+    episodes = make_episodes(2)
+    runtimes = [minutes(35)] * 3
+    m = EpisodeMap()
+    m.automap(
+        disc.titles[1:], episodes, minutes(20), minutes(50),
+        runtimes=runtimes)
+    assert [
+        (m[e][0].number, m[e][1].number) for e in episodes
+        ] == [(1, 4), (5, 8)]
+
+
+def test_automap_without_history():
+    disc = make_disc([10, 10, 10], [10, 10, 10], [15, 15, 15], [10, 10, 10])
+    episodes = make_episodes(4)
+    m = EpisodeMap()
+    m.automap(disc.titles, episodes, minutes(20), minutes(50))
+    assert [m[e].number for e in episodes] == [1, 2, 3, 4]
+
+
+def test_episode_map_ior():
+    disc = make_disc([25], [25], [25])
+    episodes = make_episodes(3)
+    m = EpisodeMap({episodes[2]: disc.titles[2]})
+    m |= {episodes[1]: disc.titles[1], episodes[0]: disc.titles[0]}
+    assert isinstance(m, EpisodeMap)
+    assert list(m) == episodes
+    assert m.episodes(disc.titles[1]) == [episodes[1]]
+
+
+def test_automap_discs_bounded():
+    # Every disc can be split three ways; without a bound the number of plans
+    # would be 3 ** 10
+    discs = [make_disc([5] * 8).titles for i in range(10)]
+    episodes = make_episodes(20)
+    choices = []
+    def choose_mapping(solutions):
+        choices.append(len(solutions))
+        return solutions[0]
+    m = EpisodeMap()
+    m.automap_discs(
+        discs, episodes, minutes(15), minutes(25),
+        choose_mapping=choose_mapping, max_plans=5)
+    assert choices == [5]
+    assert list(m) == episodes
+
+
+def test_automap_discs_ranked():
+    discs = [make_disc([5] * 8).titles for i in range(10)]
+    episodes = make_episodes(20)
+    m = EpisodeMap()
+    m.automap_discs(
+        discs, episodes, minutes(15), minutes(25),
+        runtimes=[minutes(20)] * 3, max_plans=5)
+    assert all(
+        m[e][1].number - m[e][0].number + 1 == 4 for e in episodes)
+
+
+def test_automap_discs_ambiguous():
+    discs = [make_disc([5] * 8).titles for i in range(2)]
+    with pytest.raises(MultipleSolutionsError):
+        EpisodeMap().automap_discs(
+            discs, make_episodes(4), minutes(15), minutes(25))
+
+
+def test_episode_map_reindex():
+    disc = make_disc([25], [25], [25], [25])
+    episodes = make_episodes(3)
+    m = EpisodeMap(zip(episodes, disc.titles))
+    for episode in episodes:
+        episode.number += 1
+    m.reindex()
+    new = make_episodes(1)[0]
+    m[new] = disc.titles[3]
+    assert [e.number for e in m] == [1, 2, 3, 4]
+    assert list(m)[1:] == episodes
+
+
+def test_automap_window_reuses_full_search(monkeypatch):
+    disc = make_disc([10, 10, 10], [10, 10, 10], [15, 15, 15], [10, 10, 10])
+    calls = []
+    original = EpisodeMap._automap
+    def counted(self, *args, **kwargs):
+        calls.append(args[2:4])
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(EpisodeMap, '_automap', counted)
+    m = EpisodeMap()
+    m.automap(
+        disc.titles, make_episodes(4), minutes(20), minutes(50),
+        runtimes=[minutes(30)] * 3)
+    assert len(calls) == 2
+    assert len(m) == 4
@@ -41,7 +41,7 @@ __keywords__ = [
     ]
 
 __requires__ = [
-    'sqlalchemy<2.0dev',
+    'sqlalchemy>=1.4,<2.0dev',
     ]
 
 __extra_requires__ = {
@@ -43,6 +43,7 @@ import readline
 from textwrap import TextWrapper
 
 from .termsize import terminal_size
+from .completion import DirectoryCache
 
 COLOR_BOLD    = '\033[1m'
 COLOR_BLACK   = '\033[30m'
@@ -81,6 +82,7 @@ class Cmd(cmd.Cmd):
         self._wrapper = TextWrapper()
         self.color_prompt = color_prompt
         self.base_prompt = self.prompt
+        self.directories = DirectoryCache()
 
     def parse_bool(self, value, default=None):
         """
@@ -162,9 +164,13 @@ class Cmd(cmd.Cmd):
     def complete_path(self, text, line, start, finish):
         "Utility routine used by path completion methods"
         path, _ = os.path.split(line)
+        try:
+            items = self.directories.listdir(os.path.expanduser(path))
+        except OSError:
+            return []
         return [
             item
-            for item in os.listdir(os.path.expanduser(path))
+            for item in items
             if item.startswith(text)
         ]
 
@@ -0,0 +1,115 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Caches used to keep tab-completion responsive.
+
+Completion happens on every press of Tab, so the candidates it offers are held
+in a prefix index (a trie) which is only rebuilt when invalidated or when it
+grows stale, rather than being queried from the database (or file-system) each
+time.
+"""
+
+import os
+import time
+
+
+class PrefixIndex():
+    "A trie of strings permitting retrieval of all strings with a prefix"
+
+    def __init__(self, items=()):
+        self._root = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        "Adds the string *item* to the index"
+        node = self._root
+        for char in item:
+            node = node.setdefault(char, {})
+        # None can't clash with a character so marks the end of an item
+        node[None] = item
+
+    def search(self, prefix):
+        "Returns a sorted list of all strings in the index starting with *prefix*"
+        node = self._root
+        for char in prefix:
+            try:
+                node = node[char]
+            except KeyError:
+                return []
+        result = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    result.append(child)
+                else:
+                    stack.append(child)
+        return sorted(result)
+
+
+class CachedIndex():
+    """
+    A PrefixIndex of the strings returned by *load*.
+
+    The index is built on first use, and rebuilt on the first use after a call
+    to invalidate, or after *ttl* seconds (which catches changes made by other
+    processes).
+    """
+
+    def __init__(self, load, ttl=60):
+        self._load = load
+        self._ttl = ttl
+        self._index = None
+        self._expires = 0
+
+    def invalidate(self):
+        "Discards the index"
+        self._index = None
+
+    def search(self, prefix):
+        "Returns a sorted list of all strings starting with *prefix*"
+        now = time.monotonic()
+        if self._index is None or now >= self._expires:
+            self._index = PrefixIndex(self._load())
+            self._expires = now + self._ttl
+        return self._index.search(prefix)
+
+
+class DirectoryCache():
+    "A cache of directory listings which expire after *ttl* seconds"
+
+    def __init__(self, ttl=5):
+        self._ttl = ttl
+        self._listings = {}
+
+    def listdir(self, path):
+        "Returns the (possibly cached) entries of the directory *path*"
+        now = time.monotonic()
+        try:
+            expires, entries = self._listings[path]
+        except KeyError:
+            pass
+        else:
+            if now < expires:
+                return entries
+        entries = os.listdir(path)
+        self._listings[path] = (now + self._ttl, entries)
+        return entries
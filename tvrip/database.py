@@ -19,30 +19,61 @@
 """Implements the data model for the tvrip application's database"""
 
 import os
+import json
+import logging
 import tempfile
 from datetime import timedelta
 
 from sqlalchemy import (
     Column, ForeignKeyConstraint, ForeignKey,
-    CheckConstraint, create_engine, event
+    CheckConstraint, create_engine, event, inspect
 )
 from sqlalchemy.engine import Engine
-from sqlalchemy.types import Unicode, Integer, Boolean
+from sqlalchemy.types import (
+    Unicode, UnicodeText, Integer, Boolean, Float, DateTime
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, synonym, sessionmaker
+from sqlalchemy.orm import relationship, synonym, sessionmaker, scoped_session
+from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.collections import attribute_mapped_collection
 
 from .const import DATADIR
 
 
-Session = sessionmaker()
+# The interpreter commits after every command but keeps the configuration (and
+# everything hanging off it) around for the life of the application; there's
+# no point re-loading all of that after each commit as nothing else writes to
+# the database behind our back
+Session = sessionmaker(expire_on_commit=False)
 DeclarativeBase = declarative_base()
 
 
-# Enable foreign keys in SQLite
+# The journal mode requested of SQLite (set by init_session). The write-ahead
+# log means readers never block the writer (or vice versa), but relies on
+# shared memory which is unsafe when the database resides on a network
+# file-system; the rollback journal ('delete') is the safe alternative
+JOURNAL_MODE = 'wal'
+
+
+# Enable foreign keys in SQLite, and configure it for concurrent access: the
+# busy timeout makes writers wait their turn rather than failing with
+# "database is locked"
 @event.listens_for(Engine, 'connect')
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    # SQLite returns the journal mode actually in effect, which is the prior
+    # mode if the requested one is unsupported (e.g. WAL by some VFSes)
+    cursor.execute("PRAGMA journal_mode=%s" % JOURNAL_MODE)
+    mode = cursor.fetchone()[0].lower()
+    if mode != JOURNAL_MODE:
+        logging.warning(
+            'Unable to set %s journal mode; using %s', JOURNAL_MODE, mode)
+    if mode == 'wal':
+        # NORMAL is only durable in WAL mode; otherwise keep the default
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=10000")
+    cursor.execute("PRAGMA cache_size=-8192")
     cursor.close()
 
 
@@ -65,10 +96,28 @@ class Episode(DeclarativeBase):
     season_number = Column(Integer, primary_key=True)
     number = Column(Integer, CheckConstraint('number >= 1'), primary_key=True)
     name = Column(Unicode(200), nullable=False)
-    disc_id = Column(Unicode(200), nullable=True)
+    disc_id = Column(Unicode(200), nullable=True, index=True)
     disc_title = Column(Integer, nullable=True)
     start_chapter = Column(Integer, nullable=True)
     end_chapter = Column(Integer, nullable=True)
+    _duration = Column('duration', Integer, nullable=True)
+    size = Column(Integer, nullable=True)
+    # The x264 preset of the rip, or 'remux' for a stream copy
+    preset = Column(Unicode(20), nullable=True)
+
+    def _get_duration(self):
+        if self._duration is None:
+            return None
+        return timedelta(seconds=self._duration)
+
+    def _set_duration(self, value):
+        if value is None:
+            self._duration = None
+        else:
+            self._duration = int(value.total_seconds())
+
+    duration = synonym('_duration',
+                       descriptor=property(_get_duration, _set_duration))
 
     @property
     def ripped(self):
@@ -123,6 +172,126 @@ class Program(DeclarativeBase):
         return "<Program(%s)>" % repr(self.name)
 
 
+class CatalogTitle(DeclarativeBase):
+    """Represents the role of a title on a catalogued disc"""
+
+    __tablename__ = 'disc_titles'
+
+    disc_ident = Column(Unicode(200),
+                        ForeignKey('discs.ident', onupdate='cascade', ondelete='cascade'),
+                        primary_key=True)
+    number = Column(Integer, primary_key=True)
+    role = Column(Unicode(10),
+                  CheckConstraint(
+                      "role in ('episode', 'chapters', 'duplicate', "
+                      "'play-all', 'extra')"),
+                  nullable=False)
+
+    def __init__(self, disc, number, role):
+        # number must be set before disc as it keys the disc's titles
+        self.number = number
+        self.role = role
+        self.disc = disc
+
+    def __repr__(self):
+        return "<CatalogTitle(%s, %d, %s)>" % (
+            repr(self.disc_ident), self.number, repr(self.role))
+
+
+class CatalogEpisode(DeclarativeBase):
+    """Represents the mapping of an episode to a title or chapters of a disc"""
+
+    __tablename__ = 'disc_episodes'
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['program_name', 'season_number', 'episode_number'],
+            ['episodes.program_name', 'episodes.season_number', 'episodes.number'],
+            onupdate='cascade', ondelete='cascade'),
+        CheckConstraint(
+            '(end_chapter is null and start_chapter is null) '
+            'or (end_chapter >= start_chapter)'),
+        {},
+    )
+
+    program_name = Column(Unicode(200), primary_key=True)
+    season_number = Column(Integer, primary_key=True)
+    episode_number = Column(Integer, primary_key=True)
+    disc_ident = Column(Unicode(200),
+                        ForeignKey('discs.ident', onupdate='cascade', ondelete='cascade'),
+                        nullable=False, index=True)
+    title = Column(Integer, nullable=False)
+    start_chapter = Column(Integer, nullable=True)
+    end_chapter = Column(Integer, nullable=True)
+    episode = relationship('Episode')
+
+    def __init__(self, episode, disc_ident, title, start_chapter=None,
+                 end_chapter=None):
+        self.episode = episode
+        self.disc_ident = disc_ident
+        self.title = title
+        self.start_chapter = start_chapter
+        self.end_chapter = end_chapter
+
+    def __repr__(self):
+        return "<CatalogEpisode(%s, %d, %d, %s, %d)>" % (
+            repr(self.program_name), self.season_number, self.episode_number,
+            repr(self.disc_ident), self.title)
+
+
+class CatalogDisc(DeclarativeBase):
+    """Represents a disc which has been scanned"""
+
+    __tablename__ = 'discs'
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['program_name', 'season_number'],
+            ['seasons.program_name', 'seasons.number'],
+            onupdate='cascade', ondelete='cascade'),
+        {},
+    )
+
+    ident = Column(Unicode(200), primary_key=True)
+    serial = Column(Unicode(200), nullable=True)
+    name = Column(Unicode(200), nullable=True)
+    source = Column(Unicode(300), nullable=True)
+    scanned = Column(DateTime, nullable=True)
+    _scan = Column('scan', UnicodeText, nullable=True)
+    program_name = Column(Unicode(200), nullable=True)
+    season_number = Column(Integer, nullable=True)
+    season = relationship('Season')
+    titles = relationship('CatalogTitle', backref='disc',
+                          collection_class=attribute_mapped_collection('number'),
+                          cascade='all, delete-orphan')
+
+    def _get_scan(self):
+        if self._scan is None:
+            return []
+        return json.loads(self._scan)
+
+    def _set_scan(self, value):
+        self._scan = json.dumps(list(value))
+
+    # The raw output of each HandBrake scan of the disc, from which the Disc
+    # can be reconstructed (see Disc.from_output) without re-scanning
+    scan = synonym('_scan', descriptor=property(_get_scan, _set_scan))
+
+    def __init__(self, ident, serial, name, season=None):
+        self.ident = ident
+        self.serial = serial
+        self.name = name
+        self.season = season
+
+    def set_role(self, number, role):
+        """Sets the role of the specified title number"""
+        try:
+            self.titles[number].role = role
+        except KeyError:
+            CatalogTitle(self, number, role)
+
+    def __repr__(self):
+        return "<CatalogDisc(%s)>" % repr(self.ident)
+
+
 class AudioLanguage(DeclarativeBase):
     """Represents an audio language in the stored configuration"""
 
@@ -180,6 +349,56 @@ class ConfigPath(DeclarativeBase):
         return "<ConfigPath(%s, %s)>" % (repr(self.name), repr(self.path))
 
 
+class ConfigPreset(DeclarativeBase):
+    """Represents the preferred encoder preset for a style of video"""
+
+    __tablename__ = 'config_presets'
+
+    config_id = Column(Integer,
+                       ForeignKey('config.id', onupdate='cascade', ondelete='cascade'),
+                       default=1, primary_key=True)
+    video_style = Column(Unicode(10),
+                         CheckConstraint("video_style in ('tv', 'film', 'animation')"),
+                         primary_key=True)
+    preset = Column(Unicode(10), nullable=False)
+    threads = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, config, video_style, preset, threads=0):
+        self.config = config
+        self.video_style = video_style
+        self.preset = preset
+        self.threads = threads
+
+    def __repr__(self):
+        return "<ConfigPreset(%s, %s, %d)>" % (
+            repr(self.video_style), repr(self.preset), self.threads)
+
+
+class EncoderRate(DeclarativeBase):
+    """Represents the measured speed of an encoder preset on this machine"""
+
+    __tablename__ = 'encoder_rates'
+
+    config_id = Column(Integer,
+                       ForeignKey('config.id', onupdate='cascade', ondelete='cascade'),
+                       default=1, primary_key=True)
+    preset = Column(Unicode(10), primary_key=True)
+    threads = Column(Integer, primary_key=True)
+    fps = Column(Float, nullable=False)
+    bitrate = Column(Integer, nullable=False)
+
+    def __init__(self, config, preset, threads, fps, bitrate):
+        self.config = config
+        self.preset = preset
+        self.threads = threads
+        self.fps = fps
+        self.bitrate = bitrate
+
+    def __repr__(self):
+        return "<EncoderRate(%s, %d, %.1f)>" % (
+            repr(self.preset), self.threads, self.fps)
+
+
 class Configuration(DeclarativeBase):
     """Represents a stored configuration for the application"""
 
@@ -216,10 +435,12 @@ class Configuration(DeclarativeBase):
                     CheckConstraint("decomb in ('off', 'on', 'auto')"),
                     nullable=False, default='off')
     audio_all = Column(Boolean, nullable=False, default=False)
-    audio_langs = relationship('AudioLanguage', backref='config')
+    audio_langs = relationship('AudioLanguage', backref='config',
+                               cascade='all, delete-orphan')
     subtitle_all = Column(Boolean, nullable=False, default=False)
     subtitle_default = Column(Boolean, nullable=False, default=False)
-    subtitle_langs = relationship('SubtitleLanguage', backref='config')
+    subtitle_langs = relationship('SubtitleLanguage', backref='config',
+                                  cascade='all, delete-orphan')
     video_style = Column(Unicode(10),
                          CheckConstraint("video_style in ('tv', 'film', 'animation')"),
                          nullable=False, default='tv')
@@ -227,7 +448,11 @@ class Configuration(DeclarativeBase):
     duplicates = Column(Unicode(5),
                         CheckConstraint("duplicates in ('all', 'first', 'last')"),
                         nullable=False, default='all')
+    deadline = Column(DateTime, nullable=True)
+    remux = Column(Boolean, nullable=False, default=False, server_default='0')
     paths = relationship('ConfigPath', backref='config')
+    presets = relationship('ConfigPreset', backref='config')
+    rates = relationship('EncoderRate', backref='config')
     program = relationship('Program')
     season = relationship('Season',
                           primaryjoin='and_('
@@ -253,52 +478,187 @@ class Configuration(DeclarativeBase):
     duration_max = synonym('_duration_max',
                            descriptor=property(_get_duration_max, _set_duration_max))
 
+    # The utility paths and language selections are consulted for every title
+    # scanned and every track ripped but change rarely, so they're cached in
+    # dicts and sets built on first use and discarded when altered via the
+    # methods below
+
+    def _invalidate(self):
+        self.__dict__.pop('_path_cache', None)
+        self.__dict__.pop('_audio_cache', None)
+        self.__dict__.pop('_subtitle_cache', None)
+
     def in_audio_langs(self, lang):
         """Returns True if lang is a selected audio language"""
-        return any(l.lang == lang for l in self.audio_langs)
+        try:
+            langs = self._audio_cache
+        except AttributeError:
+            langs = self._audio_cache = {l.lang for l in self.audio_langs}
+        return lang in langs
 
     def in_subtitle_langs(self, lang):
         """Returns True if lang is a selected subtitle language"""
-        return any(l.lang == lang for l in self.subtitle_langs)
+        try:
+            langs = self._subtitle_cache
+        except AttributeError:
+            langs = self._subtitle_cache = {l.lang for l in self.subtitle_langs}
+        return lang in langs
+
+    def set_audio_langs(self, langs):
+        """Sets the selected audio languages to the iterable langs"""
+        new_langs = set(langs)
+        for lang in list(self.audio_langs):
+            if lang.lang in new_langs:
+                new_langs.remove(lang.lang)
+            else:
+                self.audio_langs.remove(lang)
+        for lang in new_langs:
+            AudioLanguage(self, lang)
+        self._invalidate()
+
+    def set_subtitle_langs(self, langs):
+        """Sets the selected subtitle languages to the iterable langs"""
+        new_langs = set(langs)
+        for lang in list(self.subtitle_langs):
+            if lang.lang in new_langs:
+                new_langs.remove(lang.lang)
+            else:
+                self.subtitle_langs.remove(lang)
+        for lang in new_langs:
+            SubtitleLanguage(self, lang)
+        self._invalidate()
 
     def get_path(self, name):
         """Returns the configured path of the specified utility"""
-        session = Session.object_session(self)
-        return session.query(ConfigPath).\
-            filter(ConfigPath.config_id == self.id).\
-            filter(ConfigPath.name == name).one().path
+        try:
+            paths = self._path_cache
+        except AttributeError:
+            paths = self._path_cache = {p.name: p.path for p in self.paths}
+        try:
+            return paths[name]
+        except KeyError:
+            raise NoResultFound('No path named {}'.format(name))
 
     def set_path(self, name, value):
         """Sets the configured path of the specified utility"""
         session = Session.object_session(self)
-        session.query(ConfigPath).\
-            filter(ConfigPath.config_id == self.id).\
-            filter(ConfigPath.name == name).one().path = value
+        for path in self.paths:
+            if path.name == name:
+                path.path = value
+                break
+        else:
+            raise NoResultFound('No path named {}'.format(name))
+        self._invalidate()
         session.commit()
 
+    def get_preset(self, video_style=None):
+        """Returns the preferred encoder preset and threads for video_style
+
+        If video_style is not specified, the configured video_style is used.
+        If no preset has been chosen for the style, x264's default (medium,
+        with automatic threading) is returned.
+        """
+        if video_style is None:
+            video_style = self.video_style
+        for preset in self.presets:
+            if preset.video_style == video_style:
+                return preset.preset, preset.threads
+        return 'medium', 0
+
+    def set_preset(self, preset, threads=0, video_style=None):
+        """Sets the preferred encoder preset and threads for video_style"""
+        if video_style is None:
+            video_style = self.video_style
+        for existing in self.presets:
+            if existing.video_style == video_style:
+                existing.preset = preset
+                existing.threads = threads
+                break
+        else:
+            Session.object_session(self).add(
+                ConfigPreset(self, video_style, preset, threads))
+
+    def get_rate(self, preset, threads=0):
+        """Returns the measured EncoderRate of the preset or None"""
+        for rate in self.rates:
+            if rate.preset == preset and rate.threads == threads:
+                return rate
+        return None
+
+    def set_rate(self, preset, threads, fps, bitrate):
+        """Records the measured speed and bitrate of the preset"""
+        rate = self.get_rate(preset, threads)
+        if rate is None:
+            Session.object_session(self).add(
+                EncoderRate(self, preset, threads, fps, bitrate))
+        else:
+            rate.fps = fps
+            rate.bitrate = bitrate
+
     def __repr__(self):
         return "<Configuration(...)>"
 
 
-SESSION = None
+def upgrade_schema(engine):
+    """Adds columns and indexes missing from tables created by earlier versions
 
-
-def init_session(url=None, debug=False):
+    SQLAlchemy's create_all only creates tables which do not exist yet. This
+    routine handles the other common case of a table which has gained new
+    (nullable, or server-defaulted) columns or new indexes since the database
+    was created.
+    """
+    inspector = inspect(engine)
+    for table in DeclarativeBase.metadata.sorted_tables:
+        existing = {
+            column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                sql = 'ALTER TABLE {table} ADD COLUMN {column} {type}'.format(
+                    table=table.name, column=column.name,
+                    type=column.type.compile(engine.dialect))
+                if column.server_default is not None:
+                    sql += " DEFAULT '{}'".format(column.server_default.arg)
+                    if not column.nullable:
+                        sql += ' NOT NULL'
+                engine.execute(sql)
+        existing = {
+            index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+
+
+ENGINE = None
+
+# This registry returns the calling thread's session, creating it if necessary.
+# At present only the main thread uses the database, but should that change
+# threads must not share sessions
+ThreadSession = scoped_session(Session)
+
+
+def init_session(url=None, debug=False, journal_mode='wal'):
     """Initializes the connection to the database and returns a new session
 
-    This routine must be called once during the application to open the
-    connection to the tvrip database and obtain a session object for
-    manipulating that connection.
+    The first call opens the connection to the tvrip database, creating or
+    upgrading the schema as necessary. The *journal_mode* may be 'wal' or
+    'delete' (the rollback journal, which should be used if the database
+    resides on a network file-system). Every call returns the session for the
+    calling thread.
     """
-    # The SESSION global is simply used to ensure this is a one-time call so
-    # multiple simultaneous database connections don't get opened
-    global SESSION
-    assert SESSION is None
-
-    if url is None:
-        url = 'sqlite:///%s' % os.path.join(DATADIR, 'tvrip.db')
-    engine = create_engine(url, echo=debug)
-    SESSION = Session(bind=engine)
-    DeclarativeBase.metadata.bind = engine
-    DeclarativeBase.metadata.create_all()
-    return SESSION
+    # The ENGINE global ensures the database is only opened once; every
+    # session shares its connection pool
+    global ENGINE, JOURNAL_MODE
+    if ENGINE is None:
+        JOURNAL_MODE = journal_mode
+        if url is None:
+            url = 'sqlite:///%s' % os.path.join(DATADIR, 'tvrip.db')
+        # SQLite connections are never shared between threads (each checkout
+        # is a new connection), but a session abandoned by a finished thread
+        # may be cleaned up by another
+        ENGINE = create_engine(
+            url, echo=debug, connect_args={'check_same_thread': False})
+        Session.configure(bind=ENGINE)
+        DeclarativeBase.metadata.bind = ENGINE
+        DeclarativeBase.metadata.create_all()
+        upgrade_schema(ENGINE)
+    return ThreadSession()
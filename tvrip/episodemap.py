@@ -24,9 +24,13 @@ includes some additional methods for automatically calculating a mapping that
 meets certain criteria (duration-based).
 """
 
+import heapq
 import logging
+import statistics
+from bisect import bisect, bisect_left
 from datetime import timedelta
-from operator import attrgetter
+from operator import attrgetter, itemgetter
+from collections import Counter
 from collections.abc import KeysView, ValuesView, ItemsView
 
 from tvrip.database import Episode
@@ -58,66 +62,120 @@ def partition_ends(seq, counts):
         yield (s[0], s[-1])
 
 
-def valid(mapping, chapters, episodes, duration_min, duration_max):
-    "Checks whether a possible mapping is valid"
-    return (
-        # Check the mapping covers all the specified episodes
-        (len(mapping) == len(episodes)) and
-        # Check the mapping covers all available chapters precisely
-        (sum(mapping) == len(chapters)) and
-        # Check the title of each start+end chapter is equal (episodes don't
-        # cross titles)
-        all(
-            start.title.number == end.title.number
-            for (start, end) in partition_ends(chapters, mapping)
-        ) and
-        # Check each grouping of chapters has a valid duration
-        all(
-            duration_min <= sum(
-                (chapter.duration for chapter in episode_chapters),
-                timedelta()
-            ) <= duration_max
-            for episode_chapters in partition(chapters, mapping)
-        )
-    )
-
-
-def calculate(
-        chapters, episodes, duration_min, duration_max,
-        mapping=None, solutions=None):
-    "Recursive function for calculating mapping solutions"
-    if mapping is None:
-        mapping = []
-    if solutions is None:
-        solutions = []
-    duration = timedelta()
+def to_ms(duration):
+    "Converts a timedelta to integer milliseconds"
+    return duration // timedelta(milliseconds=1)
+
+
+def calculate(chapters, episodes, duration_min, duration_max):
+    "Calculates all chapter mapping solutions"
     # We represent mappings within this function as a list of chapter counts,
     # hence the mapping [2, 3, 4, 2] means the first episode consists of two
     # chapters, the second episode consists of the next three chapters and so
-    # on. The loop below takes the slice of the available chapters beyond those
-    # already mapped, and attempts to add each chapter in turn to the next
-    # unripped episode.
-    for count, chapter in enumerate(chapters[sum(mapping):]):
-        duration += chapter.duration
-        if duration > duration_max:
-            # If we've exceeded the maximum duration, stop. We break here as
-            # all further solutions down this branch would be invalid
-            break
-        elif duration >= duration_min:
-            new_map = mapping + [count + 1]
-            # If the duration of the group of chapters is within range, check
-            # whether the mapping is a whole is valid and add it to the
-            # solutions list if so
-            if valid(new_map, chapters, episodes, duration_min, duration_max):
-                solutions.append(new_map)
-            # Regardless of whether the current mapping is valid (it could be
-            # the start of a valid mapping), recursively call ourselves with
-            # the new group appended to the mapping
-            calculate(
-                chapters, episodes, duration_min, duration_max,
-                new_map, solutions)
-    if not mapping:
-        return solutions
+    # on. A mapping is a solution if it covers all the chapters precisely,
+    # every group of chapters lies within a single title (episodes don't cross
+    # titles) and has a valid duration, and there is a group for each of the
+    # episodes (if episodes is None, any number of groups is accepted).
+    #
+    # Durations are handled as integer milliseconds from the titles' timelines
+    # to avoid timedelta arithmetic in the inner loop
+    durations = [chapter.duration_ms for chapter in chapters]
+    titles = [chapter.title.number for chapter in chapters]
+    count = None if episodes is None else len(episodes)
+    duration_min = to_ms(duration_min)
+    duration_max = to_ms(duration_max)
+    solutions = []
+
+    def search(mapping, index):
+        # The loop below takes the slice of the available chapters beyond
+        # those already mapped, and attempts to add each chapter in turn to
+        # the next unripped episode
+        duration = 0
+        for end in range(index, len(durations)):
+            if titles[end] != titles[index]:
+                break
+            duration += durations[end]
+            if duration > duration_max:
+                # If we've exceeded the maximum duration, stop. We break here
+                # as all further solutions down this branch would be invalid
+                break
+            elif duration >= duration_min:
+                new_map = mapping + [end - index + 1]
+                if end + 1 == len(durations):
+                    if count is None or len(new_map) == count:
+                        solutions.append(new_map)
+                elif count is None or len(new_map) < count:
+                    # The group is valid but chapters remain; recurse to
+                    # assign them to the following episodes
+                    search(new_map, end + 1)
+
+    if durations:
+        search([], 0)
+    return solutions
+
+
+def runtime_window(runtimes, duration_min, duration_max, min_samples=3):
+    "Narrows the duration range to that suggested by historical runtimes"
+    # The window is the range of previously ripped runtimes padded by twice
+    # their standard deviation (but at least a minute), clamped to the
+    # configured duration range. With too few samples, or if the history lies
+    # entirely outside the configured range, the latter is returned unchanged
+    if len(runtimes) < min_samples:
+        return duration_min, duration_max
+    slack = max(
+        timedelta(minutes=1),
+        timedelta(seconds=2 * statistics.pstdev(
+            r.total_seconds() for r in runtimes)))
+    low = max(duration_min, min(runtimes) - slack)
+    high = min(duration_max, max(runtimes) + slack)
+    if low > high:
+        return duration_min, duration_max
+    return low, high
+
+
+def coverage(mapping):
+    "Returns the number of episodes and of distinct targets in *mapping*"
+    return len(mapping), len(set(mapping.values()))
+
+
+def deviation(mapping, chapters, expected):
+    "Returns the total deviation of a solution's episodes from *expected*"
+    expected = to_ms(expected)
+    return timedelta(milliseconds=sum(
+        abs(sum(chapter.duration_ms for chapter in episode_chapters) - expected)
+        for episode_chapters in partition(chapters, mapping)
+        ))
+
+
+def duration(target):
+    "Returns the duration of a Title or a (Chapter, Chapter) range"
+    if isinstance(target, Title):
+        return target.duration
+    start, end = target
+    if start.title.number == end.title.number:
+        return timedelta(milliseconds=end.finish_ms - start.start_ms)
+    return timedelta(milliseconds=(
+        start.title.chapters_ms - start.start_ms +
+        sum(
+            title.chapters_ms
+            for title in start.title.disc.titles
+            if start.title.number < title.number < end.title.number
+            ) +
+        end.finish_ms))
+
+
+def spread(mapping, expected):
+    """
+    Returns the total deviation of the episodes of *mapping* from the
+    *expected* runtime, or no deviation if *expected* is None
+    """
+    if expected is None:
+        return timedelta()
+    counts = Counter(mapping.values())
+    return sum((
+        abs(duration(target) / counts[target] - expected)
+        for target in mapping.values()
+        ), timedelta())
 
 
 class MapError(Exception):
@@ -141,13 +199,26 @@ class MultipleSolutionsError(MapError):
 
 
 class EpisodeMap(dict):
-    "Represents a mapping of episodes to titles/chapters"
+    """
+    Represents a mapping of episodes to titles/chapters.
+
+    In addition to the mapping itself, the class maintains the list of mapped
+    episodes in ascending order of number, and a reverse index of the episodes
+    mapped to each target (a Title or (Chapter, Chapter) tuple), so that
+    ordered iteration, value membership tests, and reverse lookups do not need
+    to scan the whole map.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._order = []
+        self._numbers = []
+        self._targets = {}
+        self.update(*args, **kwargs)
 
     def __iter__(self):
         # Ensures that iterating the map returns episodes in ascending order
-        for episode in sorted(
-                super().__iter__(), key=attrgetter('number')):
-            yield episode
+        return iter(list(self._order))
 
     def __setitem__(self, key, value):
         # Ensures values are either a Title or a (Chapter, Chapter) tuple.
@@ -158,7 +229,90 @@ class EpisodeMap(dict):
             assert isinstance(finish, Chapter)
         except (TypeError, ValueError):
             assert isinstance(value, Title)
+        if key in self:
+            self._unindex(key)
         super().__setitem__(key, value)
+        index = bisect(self._numbers, key.number)
+        self._numbers.insert(index, key.number)
+        self._order.insert(index, key)
+        episodes = self._targets.setdefault(value, [])
+        episodes.insert(
+            bisect([e.number for e in episodes], key.number), key)
+
+    def __delitem__(self, key):
+        self._unindex(key)
+        super().__delitem__(key)
+
+    def _unindex(self, key):
+        value = self[key]
+        index = bisect_left(self._numbers, key.number)
+        while index < len(self._order) and self._order[index] is not key:
+            index += 1
+        if index == len(self._order):
+            # The episode has been renumbered since it was mapped
+            index = self._order.index(key)
+        del self._order[index]
+        del self._numbers[index]
+        episodes = self._targets[value]
+        episodes.remove(key)
+        if not episodes:
+            del self._targets[value]
+
+    def clear(self):
+        super().clear()
+        self._order.clear()
+        self._numbers.clear()
+        self._targets.clear()
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): episode map is empty')
+        key = self._order[-1]
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        # dict's implementation of |= would bypass the indexes
+        self.update(other)
+        return self
+
+    def copy(self):
+        return EpisodeMap(self.items())
+
+    def reindex(self):
+        """
+        Rebuilds the order of the map after its episodes have been renumbered.
+
+        The indexes are keyed on the number of each episode when it was
+        mapped, so this must be called whenever mapped episodes are
+        renumbered (e.g. by inserting or deleting an episode before them).
+        """
+        self._order.sort(key=attrgetter('number'))
+        self._numbers[:] = [episode.number for episode in self._order]
+        for episodes in self._targets.values():
+            episodes.sort(key=attrgetter('number'))
+
+    def episodes(self, target):
+        "Returns the episodes mapped to the specified Title or chapter range"
+        return list(self._targets.get(target, []))
 
     def keys(self):
         return EpisodeKeys(self)
@@ -170,28 +324,86 @@ class EpisodeMap(dict):
         return EpisodeItems(self)
 
     def automap(self, titles, episodes, duration_min, duration_max,
-                *, strict_mapping=False, permit_multipart=True, choose_mapping=None):
-        "Automatically map unmapped titles to unripped episodes"
+                *, strict_mapping=False, permit_multipart=True, choose_mapping=None,
+                runtimes=None):
+        """
+        Automatically map unmapped titles to unripped episodes.
+
+        If *runtimes* is specified, it must be a sequence of the (timedelta)
+        durations of previously ripped episodes of the program. These are used
+        to rank multiple chapter-based solutions, and to try a mapping with a
+        duration range narrowed to the historical runtimes. The narrowed
+        mapping is only used if it covers as many episodes and titles as the
+        mapping with the configured range (i.e. when it merely resolves an
+        ambiguity); history never excludes a title that would otherwise be
+        mapped.
+        """
         if not episodes:
             raise NoEpisodesError('No episodes available for mapping (new season?)')
+        if not titles:
+            raise NoMappingError('No titles available for mapping')
+        if runtimes is None:
+            runtimes = []
+        window = runtime_window(runtimes, duration_min, duration_max)
+        result = None
+        if window != (duration_min, duration_max):
+            logging.debug(
+                'Trying historical duration range %s-%s', *window)
+            # Neither attempt is permitted to prompt; choose_mapping is only
+            # used if the configured range must be searched again below
+            try:
+                narrowed = self._automap(
+                    titles, episodes, window[0], window[1],
+                    strict_mapping=strict_mapping,
+                    permit_multipart=permit_multipart, runtimes=runtimes)
+            except MapError:
+                narrowed = None
+            if narrowed is not None:
+                try:
+                    result = self._automap(
+                        titles, episodes, duration_min, duration_max,
+                        strict_mapping=strict_mapping,
+                        permit_multipart=permit_multipart, runtimes=runtimes)
+                except MapError:
+                    # Either nothing maps with the configured range (which
+                    # can't really happen as it contains the window), or it
+                    # is ambiguous in which case the narrowed mapping is one
+                    # of its solutions
+                    result = None
+                if result is None or all(
+                        n >= f for n, f in zip(coverage(narrowed), coverage(result))):
+                    self.update(narrowed)
+                    return
+            logging.debug('Falling back to configured duration range')
+        if result is None:
+            result = self._automap(
+                titles, episodes, duration_min, duration_max,
+                strict_mapping=strict_mapping,
+                permit_multipart=permit_multipart,
+                choose_mapping=choose_mapping, runtimes=runtimes)
+        self.update(result)
+
+    def _automap(self, titles, episodes, duration_min, duration_max,
+                 *, strict_mapping=False, permit_multipart=True,
+                 choose_mapping=None, runtimes=()):
+        "Try each of the auto-mapping algorithms in turn"
         try:
             logging.debug('Trying title-based mapping')
-            result = self._automap_titles(
+            return self._automap_titles(
                 titles, episodes, duration_min, duration_max,
                 permit_multipart=permit_multipart,
                 strict_mapping=strict_mapping)
         except NoMappingError:
             try:
                 logging.debug('Trying chapter-based algorithm with longest title')
-                result = self._automap_chapters_longest(
+                return self._automap_chapters_longest(
                     titles, episodes, duration_min, duration_max,
-                    choose_mapping=choose_mapping)
+                    choose_mapping=choose_mapping, runtimes=runtimes)
             except NoSolutionsError:
                 logging.debug('Trying chapter-based algorithm with all titles')
-                result = self._automap_chapters_all(
+                return self._automap_chapters_all(
                     titles, episodes, duration_min, duration_max,
-                    choose_mapping=choose_mapping)
-        self.update(result)
+                    choose_mapping=choose_mapping, runtimes=runtimes)
 
     def _automap_titles(self, titles, episodes, duration_min, duration_max,
                         *, strict_mapping=False, permit_multipart=True):
@@ -226,7 +438,7 @@ class EpisodeMap(dict):
         return result
 
     def _automap_chapters_longest(self, titles, episodes, duration_min, duration_max,
-                                  *, choose_mapping=None):
+                                  *, choose_mapping=None, runtimes=()):
         "Auto-mapping with chapters from the longest title in the selecteion"
         longest_title = sorted(titles, key=attrgetter('duration'))[-1]
         logging.debug(
@@ -236,25 +448,41 @@ class EpisodeMap(dict):
             len(longest_title.chapters))
         return self._automap_chapters(
             longest_title.chapters, episodes, duration_min, duration_max,
-            choose_mapping=choose_mapping)
+            choose_mapping=choose_mapping, runtimes=runtimes)
 
     def _automap_chapters_all(
             self, titles, episodes, duration_min, duration_max, *,
-            choose_mapping=None):
+            choose_mapping=None, runtimes=()):
         "Auto-mapping with chapters from all titles in the selection"
         return self._automap_chapters(
             [chapter for title in titles for chapter in title.chapters],
             episodes, duration_min, duration_max,
-            choose_mapping=choose_mapping)
+            choose_mapping=choose_mapping, runtimes=runtimes)
 
     def _automap_chapters(
             self, chapters, episodes, duration_min, duration_max, *,
-            choose_mapping=None):
+            choose_mapping=None, runtimes=()):
         "Auto-mapping with a chapter-based algorithm"
         # XXX Remove trailing empty chapters
         solutions = calculate(chapters, episodes, duration_min, duration_max)
         logging.debug(
             'Found %d chapter mapping solution(s)' % len(solutions))
+        if len(solutions) > 1 and runtimes:
+            # Rank the solutions by how closely their episodes match the
+            # historical runtime; if the best is clearly better than the
+            # runner-up (less than half its deviation) pick it outright
+            expected = statistics.median(runtimes)
+            scores = [
+                deviation(solution, chapters, expected)
+                for solution in solutions
+                ]
+            ranked = sorted(zip(scores, solutions), key=lambda s: s[0])
+            scores = [score for score, solution in ranked]
+            solutions = [solution for score, solution in ranked]
+            if scores[0] * 2 < scores[1]:
+                logging.debug(
+                    'Selected best chapter mapping by historical runtime')
+                solutions = solutions[:1]
         if not solutions:
             raise NoSolutionsError('No chapter mappings found')
         elif len(solutions) == 1:
@@ -269,6 +497,130 @@ class EpisodeMap(dict):
                 ])
         return solution
 
+    def automap_discs(self, discs, episodes, duration_min, duration_max,
+                      *, permit_multipart=True, choose_mapping=None,
+                      runtimes=None, max_plans=20):
+        """
+        Automatically map unripped episodes across several discs.
+
+        *discs* is a sequence of title lists, one for each disc of a box set
+        in the order the episodes appear on them. Each disc is assumed to hold
+        a consecutive run of *episodes* following those on the prior disc. The
+        candidate mappings of every disc (found with the same title and
+        chapter based algorithms as :meth:`automap`) are combined, and only
+        those combinations which fit together to cover the most episodes are
+        kept. Hence a disc which is ambiguous on its own can be resolved by
+        the episode counts of its neighbours. A disc for which no mapping is
+        found is assumed to contain only extras and is mapped to no episodes.
+
+        As the number of combinations grows exponentially with the number of
+        ambiguous discs, only the *max_plans* best combinations (by deviation
+        from the median of *runtimes*, if given, otherwise the first found)
+        reaching each episode are retained.
+        """
+        if not episodes:
+            raise NoEpisodesError('No episodes available for mapping (new season?)')
+        episodes = list(episodes)
+        expected = statistics.median(runtimes) if runtimes else None
+        # plans maps an offset into episodes to a list of (score, partial plan)
+        # tuples where each partial plan is a list of per-disc mappings which
+        # cover the episodes before the offset
+        plans = {0: [(timedelta(), [])]}
+        for number, titles in enumerate(discs, start=1):
+            new_plans = {}
+            cache = {}
+            for offset, partial in plans.items():
+                candidates = self._automap_disc(
+                    titles, episodes[offset:], duration_min, duration_max,
+                    permit_multipart=permit_multipart, cache=cache)
+                if not candidates:
+                    logging.debug(
+                        'No mapping for disc %d from episode %d',
+                        number, offset + 1)
+                    # Permit a disc containing nothing but extras
+                    candidates = [{}]
+                for candidate in candidates:
+                    candidate_score = spread(candidate, expected)
+                    new_plans.setdefault(offset + len(candidate), []).extend(
+                        (score + candidate_score, plan + [candidate])
+                        for score, plan in partial)
+            for offset, partial in new_plans.items():
+                if len(partial) > max_plans:
+                    logging.debug(
+                        'Discarding %d plan(s) reaching episode %d after '
+                        'disc %d', len(partial) - max_plans, offset, number)
+                    # nsmallest is stable, so plans are kept in the order
+                    # found when there is no history to rank them
+                    new_plans[offset] = heapq.nsmallest(
+                        max_plans, partial, key=itemgetter(0))
+            plans = new_plans
+        covered = max(plans)
+        if not covered:
+            raise NoSolutionsError('No mapping for any disc found')
+        ranked = sorted(plans[covered], key=itemgetter(0))
+        solutions = [
+            EpisodeMap(
+                (episode, target)
+                for mapping in plan
+                for episode, target in mapping.items()
+                )
+            for score, plan in ranked
+            ]
+        logging.debug(
+            'Found %d box-set mapping solution(s) covering %d episode(s)',
+            len(solutions), covered)
+        if len(solutions) > 1 and expected is not None:
+            if ranked[0][0] * 2 < ranked[1][0]:
+                logging.debug(
+                    'Selected best box-set mapping by historical runtime')
+                solutions = solutions[:1]
+        if len(solutions) == 1:
+            solution = solutions[0]
+        elif not choose_mapping:
+            raise MultipleSolutionsError(
+                'Multiple possible box-set mappings found')
+        else:
+            solution = choose_mapping(solutions)
+        self.update(solution)
+
+    def _automap_disc(self, titles, episodes, duration_min, duration_max,
+                      *, permit_multipart=True, cache=None):
+        """
+        Returns all candidate mappings of *titles* to a prefix of *episodes*.
+
+        The chapter solutions of *titles* don't depend on *episodes*, so if
+        *cache* (a dict) is given they are stored in it for later calls with
+        the same *titles*.
+        """
+        if cache is None:
+            cache = {}
+        if not titles or not episodes:
+            return []
+        try:
+            return [self._automap_titles(
+                titles, episodes, duration_min, duration_max,
+                permit_multipart=permit_multipart)]
+        except NoMappingError:
+            pass
+        longest_title = sorted(titles, key=attrgetter('duration'))[-1]
+        for key, chapters in enumerate((
+                longest_title.chapters,
+                [chapter for title in titles for chapter in title.chapters])):
+            if key not in cache:
+                cache[key] = calculate(
+                    chapters, None, duration_min, duration_max)
+            solutions = [
+                solution
+                for solution in cache[key]
+                if len(solution) <= len(episodes)
+                ]
+            if solutions:
+                return [
+                    dict(zip(episodes, partition_ends(chapters, solution)))
+                    for solution in solutions
+                    ]
+        return []
+
 
 class EpisodeKeys(KeysView):
     def __iter__(self):
@@ -277,6 +629,9 @@ class EpisodeKeys(KeysView):
 
 
 class EpisodeValues(ValuesView):
+    def __contains__(self, value):
+        return value in self._mapping._targets
+
     def __iter__(self):
         for key in self._mapping:
             yield self._mapping[key]
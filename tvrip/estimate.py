@@ -0,0 +1,154 @@
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012-2017 Dave Jones <dave@waveform.org.uk>.
+#
+# This file is part of tvrip.
+#
+# tvrip is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# tvrip is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# tvrip.  If not, see <http://www.gnu.org/licenses/>.
+
+"Estimates the encoding time and output size of mapped episodes"
+
+from .ripper import Title, ENCODER_PRESETS
+from .episodemap import duration
+
+
+def frames(targets):
+    """
+    Returns the number of frames which must be encoded to rip *targets*.
+
+    Each target is a Title or a (start, end) tuple of Chapters as stored in
+    an EpisodeMap.
+    """
+    result = 0
+    for target in targets:
+        title = target if isinstance(target, Title) else target[0].title
+        result += duration(target).total_seconds() * title.frame_rate
+    return result
+
+
+def choose_preset(rates, work, seconds):
+    """
+    Returns the rate of the slowest preset which can encode *work* frames
+    within *seconds*.
+
+    The *rates* are EncoderRate instances (as measured by the benchmark
+    command); where several thread counts were measured for a preset, the
+    fastest is considered. If no preset can finish within the time available
+    the fastest measured rate is returned. If *rates* is empty, None is
+    returned.
+    """
+    best = {}
+    for rate in rates:
+        if rate.preset not in best or rate.fps > best[rate.preset].fps:
+            best[rate.preset] = rate
+    if not best:
+        return None
+    for preset in reversed(ENCODER_PRESETS):
+        rate = best.get(preset)
+        if rate is not None and work / rate.fps <= seconds:
+            return rate
+    return max(best.values(), key=lambda rate: rate.fps)
+
+
+# The bitrate of each audio track; this matches the -B option given to
+# HandBrake by Disc.encode_cmdline
+AUDIO_BITRATE = 160000
+
+# Typical bitrates (in bits per second) of standard definition x264 video at
+# the quality used for each video_style; used when nothing better is known
+VIDEO_BITRATES = {
+    'film':      2000000,
+    'tv':        1500000,
+    'animation': 1000000,
+    }
+
+# The size of a DVD sector, and a typical DVD video bitrate (in bits per
+# second) for when the sizes of titles are unknown
+DVD_BLOCK_SIZE = 2048
+DVD_BITRATE = 6000000
+
+# Estimates are inflated by this factor to leave a little headroom
+MARGIN = 1.1
+
+
+def bytes_per_second(config, audio_tracks, preset=None, threads=None,
+                     history=None):
+    """
+    Returns the estimated number of bytes per second of encoded output.
+
+    If *history* (a sequence of (size, duration, preset) tuples of previous
+    rips) includes rips with *preset* (which defaults to the configured
+    preset), the average rate of those rips is used. Otherwise the rate is
+    derived from the video bitrate measured by the benchmark command for
+    *preset*, or the typical bitrate for the configured video_style, plus the
+    bitrate of *audio_tracks* audio tracks.
+    """
+    if preset is None:
+        preset, threads = config.get_preset()
+    if history:
+        history = [
+            (rip_size, rip_duration)
+            for rip_size, rip_duration, rip_preset in history
+            if rip_preset == preset
+            ]
+        total_size = sum(rip_size for rip_size, rip_duration in history)
+        total_duration = sum(
+            rip_duration.total_seconds()
+            for rip_size, rip_duration in history)
+        if total_size and total_duration:
+            return total_size / total_duration
+    rate = config.get_rate(preset, threads or 0)
+    if rate is not None:
+        video = rate.bitrate
+    else:
+        video = VIDEO_BITRATES[config.video_style]
+    return (video + audio_tracks * AUDIO_BITRATE) / 8
+
+
+def size(target, rate):
+    """
+    Returns the estimated size in bytes of ripping *target* at *rate* bytes
+    per second.
+    """
+    return int(duration(target).total_seconds() * rate * MARGIN)
+
+
+def remux_size(target):
+    """
+    Returns the estimated size in bytes of remuxing *target*.
+
+    This is derived from the number of (2KB) blocks the target occupies on
+    the disc, or a typical DVD bitrate if the block counts are unknown.
+    """
+    if isinstance(target, Title):
+        blocks = target.blocks
+    else:
+        start, end = target
+        blocks = sum(
+            chapter.blocks
+            for chapter in start.title.chapters[
+                start.title_index():end.title_index() + 1])
+    if blocks:
+        return int(blocks * DVD_BLOCK_SIZE * MARGIN)
+    return int(duration(target).total_seconds() * DVD_BITRATE / 8 * MARGIN)
+
+
+def format_size(size):
+    "Returns *size* (in bytes) as a human-readable string"
+    for suffix in ('B', 'KB', 'MB', 'GB'):
+        if size < 1000:
+            break
+        size /= 1000
+    else:
+        suffix = 'TB'
+    return '{:.1f}{}'.format(size, suffix)
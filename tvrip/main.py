@@ -31,9 +31,17 @@ class TVRipApplication(TerminalApplication):
     This command line interface simplifies the extraction and transcoding of a
     DVD containing a TV series (or a season of a TV series) via HandBrake.
     """
+    def __init__(self, version):
+        super().__init__(version)
+        self.parser.add_argument(
+            '--no-wal', dest='journal_mode', action='store_const',
+            const='delete', default='wal',
+            help='use a rollback journal instead of the write-ahead log for '
+            'the database (required if it resides on a network file-system)')
+
     def main(self, args):
         # Start the interpreter
-        cmd = RipCmd(debug=args.debug)
+        cmd = RipCmd(debug=args.debug, journal_mode=args.journal_mode)
         cmd.pprint('TVRip %s' % __version__)
         cmd.pprint('Type "help" for more information.')
         cmd.cmdloop()
@@ -20,20 +20,28 @@
 
 import os
 import re
+import csv
+import json
+import stat
+import shutil
+import tempfile
 import subprocess as proc
+from operator import attrgetter
 from datetime import timedelta, datetime
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
 
-from .ripper import Disc, Title
+from .ripper import Disc, Title, ENCODER_PRESETS
 from .database import (
     init_session, Configuration, Program, Season, Episode,
-    AudioLanguage, SubtitleLanguage, ConfigPath
+    AudioLanguage, SubtitleLanguage, ConfigPath, CatalogDisc, CatalogEpisode
     )
-from .episodemap import EpisodeMap, MapError
+from .episodemap import EpisodeMap, MapError, duration
 from .cmdline import Cmd, CmdError, CmdSyntaxError
 from .const import DATADIR
-from . import multipart
+from .completion import CachedIndex
+from . import multipart, estimate
 
 
 class RipCmd(Cmd):
@@ -41,11 +49,15 @@ class RipCmd(Cmd):
 
     prompt = '(tvrip) '
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, journal_mode='wal'):
         super().__init__()
         self.discs = {}
         self.episode_map = EpisodeMap()
-        self.session = init_session(debug=debug)
+        self.session = init_session(debug=debug, journal_mode=journal_mode)
+        # Completion indexes of program names, and season numbers by program
+        self.program_index = CachedIndex(lambda: (
+            name for (name,) in self.session.query(Program.name)))
+        self.season_index = {}
         # Specify the history filename
         self.history_file = os.path.join(DATADIR, 'tvrip.history')
         # Read the configuration from the database
@@ -56,13 +68,25 @@ class RipCmd(Cmd):
             self.session.add(self.config)
             self.session.add(AudioLanguage(self.config, 'eng'))
             self.session.add(SubtitleLanguage(self.config, 'eng'))
-            self.session.add(
-                ConfigPath(self.config, 'handbrake', 'HandBrakeCLI'))
-            self.session.add(
-                ConfigPath(self.config, 'atomicparsley', 'AtomicParsley'))
-            self.session.add(
-                ConfigPath(self.config, 'vlc', 'vlc'))
-            self.session.commit()
+        # Add default paths for any utilities which didn't exist when the
+        # configuration was created
+        for name, path in (
+                ('handbrake', 'HandBrakeCLI'),
+                ('atomicparsley', 'AtomicParsley'),
+                ('vlc', 'vlc'),
+                ('remux', 'ffmpeg'),
+                ):
+            if not any(p.name == name for p in self.config.paths):
+                self.session.add(ConfigPath(self.config, name, path))
+        self.session.commit()
+        # Restore the discs and episode mapping of the last session; the
+        # episodes explicitly unmapped since the map was last saved, and the
+        # drives whose restored discs haven't been re-scanned, are tracked
+        self.saved_map = {}
+        self.unmapped = set()
+        self.unverified = set()
+        self.restore_discs()
+        self.session.commit()
 
     def onecmd(self, line):
         # Ensure that the current transaction is committed after a command, or
@@ -70,6 +94,7 @@ class RipCmd(Cmd):
         # exception
         try:
             result = super().onecmd(line)
+            self.save_map()
         except:
             self.session.rollback()
             raise
@@ -142,10 +167,8 @@ class RipCmd(Cmd):
         """
         if '-' not in episodes:
             raise CmdSyntaxError('Expected two dash-separated numbers')
-        start, finish = (
-            self.parse_episode(i, must_exist)
-            for i in self.parse_number_range(episodes)
-            )
+        start, finish = self.get_episodes(
+            self.parse_number_range(episodes), must_exist)
         return start, finish
 
     def parse_episode_list(self, episodes, must_exist=True):
@@ -158,10 +181,51 @@ class RipCmd(Cmd):
         be thrown unless the optional must_exist flag is set to False in which
         case None will be returned for them instead.
         """
-        return [
-            self.parse_episode(i, must_exist)
-            for i in self.parse_number_list(episodes)
-            ]
+        return self.get_episodes(self.parse_number_list(episodes), must_exist)
+
+    def get_episodes(self, numbers, must_exist=True):
+        """
+        Returns the Episode objects with the specified numbers.
+
+        All the episodes are retrieved from the current program's season with
+        a single query. Missing episodes cause an error to be thrown unless
+        the optional must_exist flag is set to False in which case None will
+        be returned for them instead.
+        """
+        if not self.config.program:
+            raise CmdError('No program has been set')
+        elif not self.config.season:
+            raise CmdError('No season has been set')
+        for number in numbers:
+            if number < 1:
+                raise CmdError(
+                    'Episode number {} is less than one'.format(number))
+        found = {}
+        if numbers:
+            low, high = min(numbers), max(numbers)
+            if len(set(numbers)) == high - low + 1:
+                match = Episode.number.between(low, high)
+            else:
+                match = Episode.number.in_(set(numbers))
+            found = {
+                episode.number: episode
+                for episode in self.session.query(Episode).filter(
+                    (Episode.program_name == self.config.program_name) &
+                    (Episode.season_number == self.config.season_number) &
+                    match)
+                }
+        result = []
+        for number in numbers:
+            episode = found.get(number)
+            if episode is None and must_exist:
+                raise CmdError(
+                    'There is no episode {episode} in '
+                    'season {season} of {program}'.format(
+                        episode=number,
+                        season=self.config.season.number,
+                        program=self.config.program.name))
+            result.append(episode)
+        return result
 
     def parse_title(self, title):
         """
@@ -183,11 +247,11 @@ class RipCmd(Cmd):
         if not 1 <= title <= 99:
             raise CmdError(
                 'Title number {} is not between 1 and 99'.format(title))
-        try:
-            return [t for t in self.disc.titles if t.number == title][0]
-        except IndexError:
+        result = self.disc.get_title(title)
+        if result is None:
             raise CmdError(
                 'There is no title {} on the scanned disc'.format(title))
+        return result
 
     def parse_title_range(self, titles):
         """
@@ -227,13 +291,13 @@ class RipCmd(Cmd):
         except ValueError:
             raise CmdSyntaxError(
                 'Expected chapter number but found "{}"'.format(chapter))
-        try:
-            return [c for c in title.chapters if c.number == chapter][0]
-        except IndexError:
+        result = title.get_chapter(chapter)
+        if result is None:
             raise CmdError(
                 'There is no chapter {chapter} within title {title}'.format(
                     chapter=chapter,
                     title=title.number))
+        return result
 
     def parse_chapter_range(self, title, chapters):
         """
@@ -296,15 +360,32 @@ class RipCmd(Cmd):
         "Removes all seasons from the specified program"
         if program is None:
             program = self.config.program
-        for season in self.session.query(Season).filter((Season.program == program)):
-            self.session.delete(season)
+        # Each table is cleared with a single statement; the database would
+        # cascade the deletions itself but deleting explicitly (children
+        # first) also removes the affected objects from the session
+        for table, column in (
+                (CatalogEpisode, CatalogEpisode.program_name),
+                (Episode, Episode.program_name),
+                (Season, Season.program_name),
+                ):
+            self.session.query(table).filter(
+                column == program.name).delete(synchronize_session='evaluate')
+        self.session.expire(program, ['seasons'])
+        self.season_index.pop(program.name, None)
+        # The database nulls the configuration's season if it was deleted
+        self.session.expire(
+            self.config, ['program_name', 'season_number', 'program', 'season'])
 
     def clear_episodes(self, season=None):
         "Removes all episodes from the specified season"
         if season is None:
             season = self.config.season
-        for episode in self.session.query(Episode).filter((Episode.season == season)):
-            self.session.delete(episode)
+        for table in (CatalogEpisode, Episode):
+            self.session.query(table).filter(
+                (table.program_name == season.program_name) &
+                (table.season_number == season.number)
+            ).delete(synchronize_session='evaluate')
+        self.session.expire(season, ['episodes'])
 
     def pprint_disc(self):
         "Prints the details of the currently scanned disc"
@@ -315,13 +396,18 @@ class RipCmd(Cmd):
         self.pprint('Disc name: {}'.format(self.disc.name))
         self.pprint('Disc has {} titles'.format(len(self.disc.titles)))
         self.pprint('')
-        table = [('Title', 'Chapters', 'Duration', 'Dup', 'Audio')]
+        entry = self.catalog(self.disc)
+        roles = {} if entry is None else entry.titles
+        table = [
+            ('Title', 'Chapters', 'Duration', 'Dup', 'Contains', 'Role', 'Audio')]
         for title in self.disc.titles:
             table.append((
                 title.number,
                 len(title.chapters),
                 title.duration,
                 {'first': ' ┐', 'yes': ' │', 'last': ' ┘', 'no': ''}[title.duplicate],
+                ','.join(str(other.number) for other in title.contains),
+                roles[title.number].role if title.number in roles else '',
                 ' '.join(track.language for track in title.audio_tracks)
                 ))
         self.pprint_table(table)
@@ -337,6 +423,10 @@ class RipCmd(Cmd):
                 title=title.number, duration=title.duration,
                 duplicate=title.duplicate)
         )
+        if title.contains:
+            self.pprint('Title {title} contains titles {contains}'.format(
+                title=title.number, contains=', '.join(
+                    str(other.number) for other in title.contains)))
         self.pprint('')
         table = [('Chapter', 'Start', 'Finish', 'Duration')]
         for chapter in title.chapters:
@@ -442,11 +532,20 @@ class RipCmd(Cmd):
                 season=season.number, program=season.program.name))
         self.pprint('')
         table = [('Num', 'Title', 'Ripped')]
-        for episode in self.session.query(Episode).filter((Episode.season == season)):
+        for (number, name, ripped) in self.session.query(
+                    Episode.number,
+                    Episode.name,
+                    Episode.disc_id != None
+                ).filter(
+                    (Episode.program_name == season.program_name) &
+                    (Episode.season_number == season.number)
+                ).order_by(
+                    Episode.number
+                ).yield_per(500):
             table.append((
-                episode.number,
-                episode.name,
-                ['', 'x'][episode.ripped]
+                number,
+                name,
+                ['', 'x'][bool(ripped)]
             ))
         self.pprint_table(table)
 
@@ -501,8 +600,16 @@ class RipCmd(Cmd):
         self.pprint('subtitle_langs   = {}'.format(
             ' '.join(l.lang for l in self.config.subtitle_langs)))
         self.pprint('video_style      = {}'.format(self.config.video_style))
+        preset, threads = self.config.get_preset()
+        self.pprint('preset           = {preset} ({threads} threads)'.format(
+            preset=preset, threads=threads or 'auto'))
         self.pprint('dvdnav           = {}'.format(
             ['no', 'yes'][self.config.dvdnav]))
+        self.pprint('remux            = {}'.format(
+            ['off', 'on'][self.config.remux]))
+        self.pprint('deadline         = {}'.format(
+            self.config.deadline.strftime('%Y-%m-%d %H:%M')
+            if self.config.deadline else '<none set>'))
 
     def do_dvdnav(self, arg):
         """
@@ -520,6 +627,26 @@ class RipCmd(Cmd):
         """
         self.config.dvdnav = self.parse_bool(arg)
 
+    def do_remux(self, arg):
+        """
+        Sets whether episodes are remuxed rather than encoded.
+
+        Syntax: remux <off|on>
+
+        The 'remux' command configures archival mode. The default is 'off'
+        meaning that episodes are encoded with x264. If 'on' is specified,
+        the video and selected audio and subtitle streams are copied untouched
+        into the output by the 'remux' utility (see 'path'; this must be a
+        version of ffmpeg with DVD support). Remuxing runs at the speed the
+        disc can be read but produces much larger files. For example:
+
+        (tvrip) remux on
+        (tvrip) remux off
+
+        See also: path, rip
+        """
+        self.config.remux = self.parse_bool(arg)
+
     def do_duplicate(self, arg):
         """
         Manually specifies duplicated titles on a disc.
@@ -615,6 +742,7 @@ class RipCmd(Cmd):
 
         (tvrip) path handbrake /usr/bin/HandBrakeCLI
         (tvrip) path atomicparsley /usr/bin/AtomicParsley
+        (tvrip) path remux /usr/bin/ffmpeg
         """
         name, path = arg.split(' ', 1)
         if not os.path.exists(path):
@@ -653,6 +781,42 @@ class RipCmd(Cmd):
             raise CmdSyntaxError('Invalid video style {}'.format(arg))
         self.config.video_style = arg
 
+    def do_preset(self, arg):
+        """
+        Sets the encoder preset for the current video style.
+
+        Syntax: preset <preset> [threads]
+
+        The 'preset' command sets the x264 encoder preset (and optionally the
+        number of encoder threads, where 0 means automatic) used when ripping
+        video of the current video style. Slower presets produce smaller files
+        of the same quality but take longer to encode; the 'benchmark' command
+        measures the trade-off on this machine. The valid presets are
+        ultrafast, superfast, veryfast, faster, fast, medium, slow, slower,
+        veryslow, and placebo. For example:
+
+        (tvrip) preset medium
+        (tvrip) preset slow 4
+
+        See also: benchmark, video_style
+        """
+        args = arg.strip().lower().split()
+        if not args:
+            raise CmdSyntaxError('You must specify a preset')
+        elif len(args) > 2:
+            raise CmdSyntaxError('Too many arguments')
+        elif args[0] not in ENCODER_PRESETS:
+            raise CmdSyntaxError('Invalid encoder preset {}'.format(args[0]))
+        try:
+            threads = int(args[1]) if len(args) > 1 else 0
+        except ValueError:
+            raise CmdSyntaxError(
+                '{} is not a valid number of threads'.format(args[1]))
+        if threads < 0:
+            raise CmdSyntaxError(
+                '{} is not a valid number of threads'.format(threads))
+        self.config.set_preset(args[0], threads)
+
     def do_audio_langs(self, arg):
         """
         Sets the list of audio languages to rip.
@@ -666,15 +830,7 @@ class RipCmd(Cmd):
         (tvrip) audio_langs eng jpn
         (tvrip) audio_langs eng
         """
-        arg = arg.lower().split(' ')
-        new_langs = set(arg)
-        for lang in self.config.audio_langs:
-            if lang.lang in new_langs:
-                new_langs.remove(lang.lang)
-            else:
-                self.session.delete(lang)
-        for lang in new_langs:
-            self.session.add(AudioLanguage(self.config, lang=lang))
+        self.config.set_audio_langs(arg.lower().split(' '))
 
     def do_audio_mix(self, arg):
         """
@@ -736,15 +892,7 @@ class RipCmd(Cmd):
         (tvrip) subtitle_langs eng jpn
         (tvrip) subtitle_langs eng
         """
-        arg = arg.lower().split(' ')
-        new_langs = set(arg)
-        for lang in self.config.subtitle_langs:
-            if lang.lang in new_langs:
-                new_langs.remove(lang.lang)
-            else:
-                self.session.delete(lang)
-        for lang in new_langs:
-            self.session.add(SubtitleLanguage(self.config, lang=lang))
+        self.config.set_subtitle_langs(arg.lower().split(' '))
 
     def do_subtitle_format(self, arg):
         """
@@ -880,6 +1028,7 @@ class RipCmd(Cmd):
             raise CmdSyntaxError(
                 'You must specify an operation and an episode number')
         op = op.strip().lower()[:3]
+        name = None
         if op in ('ins', 'upd'):
             try:
                 (_, number, name) = arg.split(' ', 2)
@@ -913,8 +1062,11 @@ class RipCmd(Cmd):
                 ):
             episode.number += 1
             self.session.flush()
+        self.episode_map.reindex()
         episode = Episode(season, number, name)
         self.session.add(episode)
+        self.session.flush()
+        self.session.expire(season, ['episodes'])
         self.pprint(
             'Inserted episode {episode} to season {season} '
             'of {program}'.format(
@@ -935,6 +1087,7 @@ class RipCmd(Cmd):
     def delete_episode(self, season, number, name=None):
         # Shift all later episodes down 1
         episode = self.parse_episode(number)
+        self.episode_map.pop(episode, None)
         self.session.delete(episode)
         for episode in self.session.query(
                     Episode
@@ -946,6 +1099,9 @@ class RipCmd(Cmd):
                 ):
             episode.number -= 1
             self.session.flush()
+        self.session.flush()
+        self.episode_map.reindex()
+        self.session.expire(season, ['episodes'])
         self.pprint(
             'Deleted episode {episode} to season {season} '
             'of {program}'.format(
@@ -1005,6 +1161,118 @@ class RipCmd(Cmd):
         else:
             self.pprint_episodes()
 
+    def do_import(self, arg):
+        """
+        Imports episode names from a file.
+
+        Syntax: import <filename>
+
+        The 'import' command reads a list of episodes from the specified CSV,
+        TSV, or JSON file (determined by the file's extension) and adds them to
+        the database in a single transaction. CSV and TSV files must have a
+        header row; JSON files must contain a list of objects. The fields of
+        each row are 'program', 'season', 'number', and 'name'. If the
+        'program' or 'season' fields are missing, the current program and
+        season are assumed. For example:
+
+        (tvrip) import ~/episodes/doctor_who.csv
+        (tvrip) import ~/episodes/all.json
+
+        Programs and seasons that don't exist yet are created. Episodes which
+        already exist are renamed, but whether they have been ripped is
+        unaffected.
+
+        See also: episodes, episode
+        """
+        filename = os.path.expanduser(arg)
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in ('.csv', '.tsv', '.tab', '.json'):
+            raise CmdSyntaxError(
+                'Unrecognized file type {}; expected .csv, .tsv, or '
+                '.json'.format(ext or filename))
+        try:
+            # utf-8-sig strips the byte-order mark that spreadsheets commonly
+            # write at the start of exported files
+            with open(filename, encoding='utf-8-sig', newline='') as f:
+                if ext == '.json':
+                    rows = json.load(f)
+                else:
+                    rows = list(csv.DictReader(
+                        f, delimiter=',' if ext == '.csv' else '\t'))
+        except (IOError, ValueError, csv.Error) as exc:
+            raise CmdError(exc)
+        if not isinstance(rows, list):
+            raise CmdError('{} does not contain a list'.format(filename))
+        episodes = {}
+        for index, row in enumerate(rows, start=1):
+            try:
+                program = row.get('program') or self.config.program_name
+                season = row.get('season')
+                season = (
+                    self.config.season_number if season in (None, '') else
+                    int(season))
+                number = int(row['number'])
+                name = str(row['name']).strip()
+            except (AttributeError, KeyError, TypeError, ValueError) as exc:
+                raise CmdError(
+                    'Invalid episode at row {}: {}'.format(index, exc))
+            if program is None or season is None:
+                raise CmdError(
+                    'Row {} has no program or season and none is '
+                    'set'.format(index))
+            elif season < 0 or number < 1 or not name:
+                raise CmdError(
+                    'Invalid season, episode number, or name at row '
+                    '{}'.format(index))
+            episodes[(program, season, number)] = name
+        # Insert everything with three (executemany) statements, ignoring
+        # programs and seasons that exist and renaming existing episodes
+        self.session.flush()
+        programs = {program for program, season, number in episodes}
+        seasons = {(program, season) for program, season, number in episodes}
+        if episodes:
+            self.session.execute(
+                sqlite.insert(Program.__table__).on_conflict_do_nothing(),
+                [{'name': program} for program in programs])
+            self.session.execute(
+                sqlite.insert(Season.__table__).on_conflict_do_nothing(),
+                [
+                    {'program_name': program, 'number': season}
+                    for program, season in seasons
+                    ])
+            insert = sqlite.insert(Episode.__table__)
+            self.session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[
+                        Episode.program_name, Episode.season_number,
+                        Episode.number],
+                    set_={'name': insert.excluded.name}),
+                [
+                    {
+                        'program_name': program,
+                        'season_number': season,
+                        'number': number,
+                        'name': name,
+                    }
+                    for (program, season, number), name in episodes.items()
+                    ])
+            # Objects are not expired on commit, so reload anything already
+            # loaded which the statements above may have changed
+            self.session.expire_all()
+            self.program_index.invalidate()
+            self.season_index.clear()
+        self.pprint(
+            'Imported {episodes} episode(s) in {seasons} season(s) of '
+            '{programs} program(s)'.format(
+                episodes=len(episodes), seasons=len(seasons),
+                programs=len(programs)))
+
+    import_re = re.compile(r'^import\s+')
+
+    def complete_import(self, text, line, start, finish):
+        return self.complete_path(text, self.import_re.sub('', line),
+                                  start, finish)
+
     def do_season(self, arg):
         """
         Sets which season of the program the disc contains.
@@ -1038,6 +1306,7 @@ class RipCmd(Cmd):
         if self.config.season is None:
             self.config.season = Season(self.config.program, arg)
             self.session.add(self.config.season)
+            self.season_index.pop(self.config.program.name, None)
             try:
                 count = int(self.input(
                     'Season {season} of program {program} is new. Please '
@@ -1062,18 +1331,17 @@ class RipCmd(Cmd):
 
     def complete_season(self, text, line, start, finish):
         "Auto-completer for season command"
-        return [
-            str(season.number) for season in
-            self.session.query(
-                    Season
-                ).filter(
-                    (Season.program == self.config.program) &
-                    ("SUBSTR(CAST(season AS TEXT), 1, :length) = :season")
-                ).params(
-                    length=len(text),
-                    season=text
-                )
-            ]
+        if not self.config.program:
+            return []
+        program = self.config.program_name
+        try:
+            index = self.season_index[program]
+        except KeyError:
+            index = self.season_index[program] = CachedIndex(lambda: (
+                str(number) for (number,) in self.session.query(
+                    Season.number).filter(Season.program_name == program)
+                ))
+        return index.search(text)
 
     def do_seasons(self, arg=''):
         """
@@ -1111,6 +1379,7 @@ class RipCmd(Cmd):
         if new_program is None:
             new_program = Program(name=arg)
             self.session.add(new_program)
+            self.program_index.invalidate()
             try:
                 count = int(self.input(
                     'Program {} is new. How many seasons exist (enter '
@@ -1148,8 +1417,8 @@ class RipCmd(Cmd):
         match = self.program_re.match(line)
         name = str(line[match.end():])
         return [
-            program.name[start - match.end():] for program in
-            self.session.query(Program).filter(Program.name.startswith(name))
+            program[start - match.end():]
+            for program in self.program_index.search(name)
             ]
 
     def do_programs(self, arg=''):
@@ -1231,6 +1500,10 @@ class RipCmd(Cmd):
         source device. Please note that scanning a disc erases the current
         episode mapping.
 
+        If episodes have previously been ripped from the disc, the program and
+        season they belong to are selected automatically and the ripped
+        episodes are mapped.
+
         See also: automap, rip
         """
         if not self.config.source:
@@ -1248,39 +1521,241 @@ class RipCmd(Cmd):
         except (IOError, proc.CalledProcessError) as exc:
             self.disc = None
             raise CmdError(exc)
+        self.unverified.discard(self.disc.source)
+        self.catalog_scan(self.disc)
+        self.restore_catalog()
         self.map_ripped()
+        self.restore_map()
         self.do_disc()
 
-    def map_ripped(self):
+    def catalog(self, disc):
+        "Returns the catalog entry for *disc*, or None if it is unknown"
+        return self.session.query(CatalogDisc).get(disc.ident)
+
+    def catalog_scan(self, disc):
+        "Stores the scan output of *disc* in the catalog"
+        entry = self.catalog(disc)
+        if entry is None:
+            entry = CatalogDisc(disc.ident, disc.serial, disc.name)
+            self.session.add(entry)
+        entry.source = disc.source
+        entry.scanned = datetime.now()
+        entry.scan = disc.outputs
+        return entry
+
+    def map_snapshot(self):
+        """
+        Returns the current episode mapping in the form it is saved.
+
+        The result is a dict mapping episode keys to (episode, disc ident,
+        title number, start chapter number, end chapter number) tuples.
+        """
+        result = {}
+        for episode, target in self.episode_map.items():
+            key = self.map_key(episode)
+            if isinstance(target, Title):
+                result[key] = (
+                    episode, target.disc.ident, target.number, None, None)
+            else:
+                start, end = target
+                result[key] = (
+                    episode, start.title.disc.ident, start.title.number,
+                    start.number, end.number)
+        return result
+
+    @staticmethod
+    def map_key(episode):
+        "Returns the key of *episode* in the saved map"
+        return (episode.program_name, episode.season_number, episode.number)
+
+    def save_map(self):
+        """
+        Stores any changes to the episode mapping in the catalog.
+
+        The map is cleared whenever another disc, season, or program is
+        selected, so episodes which are simply absent from the map keep their
+        saved mapping (to be restored when their disc is scanned again); only
+        the episodes explicitly unmapped are removed from the catalog.
+        """
+        current = self.map_snapshot()
+        removed = (self.saved_map.keys() - current.keys()) & self.unmapped
+        for program, season, number in removed:
+            # The row may already have gone with its episode, hence a query
+            # delete (which doesn't care) rather than session.delete
+            self.session.query(CatalogEpisode).filter(
+                (CatalogEpisode.program_name == program) &
+                (CatalogEpisode.season_number == season) &
+                (CatalogEpisode.episode_number == number)
+            ).delete(synchronize_session='evaluate')
+        for key, (episode, ident, title, start, end) in current.items():
+            try:
+                if self.saved_map[key][1:] == (ident, title, start, end):
+                    continue
+            except KeyError:
+                pass
+            if self.session.query(CatalogDisc).get(ident) is None:
+                target = self.episode_map[episode]
+                self.catalog_scan(
+                    target.disc if isinstance(target, Title) else
+                    target[0].title.disc)
+            row = self.session.query(CatalogEpisode).get(key)
+            if row is None:
+                self.session.add(
+                    CatalogEpisode(episode, ident, title, start, end))
+            else:
+                row.disc_ident = ident
+                row.title = title
+                row.start_chapter = start
+                row.end_chapter = end
+        self.saved_map = {
+            key: value for key, value in self.saved_map.items()
+            if key not in removed
+            }
+        self.saved_map.update(current)
+        self.unmapped.clear()
+
+    def restore_map(self, disc=None):
+        "Restores the saved mapping of unripped episodes to *disc*"
+        if disc is None:
+            disc = self.disc
+        restored = 0
+        for row in self.session.query(CatalogEpisode).filter(
+                CatalogEpisode.disc_ident == disc.ident):
+            episode = row.episode
+            if (
+                    episode.season is not self.config.season or
+                    episode.ripped or episode in self.episode_map):
+                continue
+            title = disc.get_title(row.title)
+            if title is None:
+                continue
+            if row.start_chapter is None:
+                self.episode_map[episode] = title
+            else:
+                start = title.get_chapter(row.start_chapter)
+                end = title.get_chapter(row.end_chapter)
+                if start is None or end is None:
+                    continue
+                self.episode_map[episode] = (start, end)
+            restored += 1
+        if restored:
+            self.pprint('Restored the mapping of {} episode(s)'.format(
+                restored))
+
+    def restore_discs(self):
+        """
+        Reconstructs the discs mapped to episodes of the current season.
+
+        Each disc is rebuilt from the scan output stored in the catalog so
+        that the mapping can be restored without re-scanning.
+        """
+        if self.config.season:
+            for entry in self.session.query(
+                        CatalogDisc
+                    ).join(
+                        CatalogEpisode
+                    ).filter(
+                        (CatalogEpisode.program_name == self.config.program_name) &
+                        (CatalogEpisode.season_number == self.config.season_number) &
+                        (CatalogDisc.source != None)
+                    ).distinct().order_by(
+                        CatalogDisc.scanned
+                    ):
+                disc = Disc.from_output(entry.scan, entry.source)
+                if disc.ident != entry.ident:
+                    continue
+                # A drive may contain a different disc by now (an image can
+                # be assumed to be unchanged); see verify_discs
+                try:
+                    device = stat.S_ISBLK(os.stat(entry.source).st_mode)
+                except OSError:
+                    device = True
+                if device:
+                    self.unverified.add(entry.source)
+                self.discs[entry.source] = disc
+                self.map_ripped(disc)
+                self.restore_map(disc)
+        self.saved_map = self.map_snapshot()
+
+    def restore_catalog(self, disc=None):
+        "Selects the program and season of a previously ripped disc"
+        if disc is None:
+            disc = self.disc
+        entry = self.catalog(disc)
+        if entry is not None and entry.season is not None and (
+                entry.season is not self.config.season):
+            self.config.program = entry.season.program
+            self.config.season = entry.season
+            self.pprint(
+                'Disc was previously ripped for season {season} of '
+                '{program}; selected it'.format(
+                    season=entry.season.number,
+                    program=entry.season.program.name))
+
+    def record_catalog(self, disc):
+        """
+        Records the season and the role of each title of *disc* in the catalog.
+
+        The roles are derived from the current episode mapping: titles mapped
+        to episodes, titles with mapped chapters, and the remaining titles
+        which are play-all titles, duplicates, or extras. They are re-derived
+        on every rip and are purely descriptive (see :meth:`pprint_disc`); in
+        particular an "extra" may simply be a title left unmapped by a partial
+        map, so auto-mapping never excludes titles on the strength of them.
+        """
+        entry = self.catalog(disc)
+        if entry is None:
+            entry = self.catalog_scan(disc)
+        entry.season = self.config.season
+        # Chapters refer to their title by proxy, so roles are keyed by disc
+        # ident and title number
+        roles = {}
+        for target in self.episode_map.values():
+            if isinstance(target, Title):
+                roles[(target.disc.ident, target.number)] = 'episode'
+            else:
+                title = target[0].title
+                roles.setdefault((title.disc.ident, title.number), 'chapters')
+        for title in disc.titles:
+            try:
+                role = roles[(disc.ident, title.number)]
+            except KeyError:
+                if title.contains:
+                    role = 'play-all'
+                elif title.duplicate != 'no':
+                    role = 'duplicate'
+                else:
+                    role = 'extra'
+            entry.set_role(title.number, role)
+
+    def map_ripped(self, disc=None):
         "Adds titles/chapters which were previously ripped to the episode map"
-        if not self.disc:
+        if disc is None:
+            disc = self.disc
+        if not disc:
             return
-        # The rather complex filter below deals with the different methods of
-        # identifying discs. In the first version of tvrip, disc serial number
-        # was used but was found to be insufficient (manufacturers sometimes
-        # repeat serial numbers or simply leave them blank), so a new mechanism
-        # involving a hash of disc details was introduced.
+        # Another instance of tvrip may have ripped from this disc, hence the
+        # query refreshes any episodes already loaded (see populate_existing
+        # below).
+        #
+        # Two methods of identifying discs exist. In the first version of
+        # tvrip, disc serial number was used but was found to be insufficient
+        # (manufacturers sometimes repeat serial numbers or simply leave them
+        # blank), so a new mechanism involving a hash of disc details was
+        # introduced. Hashed identifiers are prefixed with $H1$ so a disc's
+        # serial is only considered when it can't be mistaken for a hash; this
+        # keeps the lookup to a simple (indexed) IN test
+        disc_ids = [disc.ident]
+        if disc.serial and not disc.serial.startswith('$H1$'):
+            disc_ids.append(disc.serial)
         for episode in self.session.query(
                     Episode
                 ).filter(
-                    (Episode.season == self.config.season) &
-                    (
-                        (
-                            (Episode.disc_id.startswith('$H1$')) &
-                            (Episode.disc_id == self.disc.ident)
-                        ) |
-                        (
-                            (~Episode.disc_id.startswith('$H1$')) &
-                            (Episode.disc_id == self.disc.serial)
-                        )
-                    )
-                ):
-            try:
-                title = [
-                    t for t in self.disc.titles
-                    if t.number == episode.disc_title
-                    ][0]
-            except IndexError:
+                    (Episode.disc_id.in_(disc_ids)) &
+                    (Episode.season == self.config.season)
+                ).populate_existing():
+            title = disc.get_title(episode.disc_title)
+            if title is None:
                 self.pprint(
                     'Warning: previously ripped title {title} not found '
                     'on the scanned disc (id {id})'.format(
@@ -1290,16 +1765,9 @@ class RipCmd(Cmd):
                 if episode.start_chapter is None:
                     self.episode_map[episode] = title
                 else:
-                    try:
-                        start_chapter = [
-                            c for c in title.chapters
-                            if c.number == episode.start_chapter
-                            ][0]
-                        end_chapter = [
-                            c for c in title.chapters
-                            if c.number == episode.end_chapter
-                            ][0]
-                    except IndexError:
+                    start_chapter = title.get_chapter(episode.start_chapter)
+                    end_chapter = title.get_chapter(episode.end_chapter)
+                    if start_chapter is None or end_chapter is None:
                         self.pprint(
                             'Warning: previously ripped chapters '
                             '{start_chapter}, {end_chapter} not '
@@ -1327,7 +1795,8 @@ class RipCmd(Cmd):
         If no title numbers are specified, all titles on the disc are
         considered candidates. Otherwise, only the titles specified are
         considered. If title mapping fails, chapter-based mapping is attempted
-        instead.
+        instead. Titles which contain several other titles (such as "play
+        all" titles) and filtered duplicates are never considered.
 
         The current episode mapping can be viewed in the output of the 'map'
         command.
@@ -1374,48 +1843,171 @@ class RipCmd(Cmd):
             title for title in titles
             if title not in self.episode_map.values()
             ]
-        # Filter out duplicate titles on the disc
-        titles = [
-            title for title in titles
-            if title.duplicate == 'no' or
-            self.config.duplicates == 'all' or
-            self.config.duplicates == title.duplicate
-            ]
+        titles = self.filter_titles(titles)
         try:
             self.episode_map.automap(
                 titles, episodes, self.config.duration_min,
                 self.config.duration_max,
                 strict_mapping=strict_mapping,
-                choose_mapping=self.choose_mapping)
+                choose_mapping=self.choose_mapping,
+                runtimes=self.runtimes())
+        except MapError as exc:
+            raise CmdError(str(exc))
+        self.do_map()
+
+    def do_boxset(self, arg=''):
+        """
+        Maps episodes across all scanned discs of a box set.
+
+        Syntax: boxset [sources]
+
+        The 'boxset' command maps all unripped episodes of the current season
+        across several discs at once. Each disc must first be scanned by
+        setting the 'source' to each drive or disc image in turn and using the
+        'scan' command. If no sources are specified, all scanned discs are
+        used in the order of their source names. Otherwise, sources are given
+        as a space separated list in the order of the discs in the box set.
+
+        The discs are assumed to contain consecutive runs of episodes. Because
+        the mapping of every disc must fit with the others, a disc which would
+        be ambiguous when mapped alone can often be resolved. The resulting
+        map can be ripped with a single 'rip' command. For example:
+
+        (tvrip) boxset
+        (tvrip) boxset ~/iso/disc1.iso ~/iso/disc2.iso
+
+        See also: automap, scan, source
+        """
+        if not self.config.season:
+            raise CmdError('No season has been set')
+        if arg.strip():
+            sources = [os.path.expanduser(s) for s in arg.split()]
+            for source in sources:
+                if source not in self.discs:
+                    raise CmdError(
+                        'No disc has been scanned from {}'.format(source))
+        else:
+            sources = sorted(self.discs)
+        if not sources:
+            raise CmdError('No disc has been scanned yet')
+        self.pprint('Performing box-set mapping of {} discs'.format(len(sources)))
+        self.episode_map.clear()
+        for source in sources:
+            self.map_ripped(self.discs[source])
+        episodes = [
+            episode for episode in self.session.query(
+                    Episode
+                ).filter(
+                    (Episode.season == self.config.season) &
+                    (Episode.disc_id == None)
+                ).order_by(
+                    Episode.number
+                )
+            if episode not in self.episode_map
+            ]
+        mapped = set(self.episode_map.values())
+        discs = [
+            self.filter_titles(
+                title for title in self.discs[source].titles
+                if title not in mapped)
+            for source in sources
+            ]
+        try:
+            self.episode_map.automap_discs(
+                discs, episodes, self.config.duration_min,
+                self.config.duration_max,
+                choose_mapping=self.choose_mapping,
+                runtimes=self.runtimes())
         except MapError as exc:
             raise CmdError(str(exc))
+        mapped = {
+            (target.disc if isinstance(target, Title) else
+             target[0].title.disc).ident
+            for target in self.episode_map.values()
+            }
+        for source in sources:
+            if self.discs[source].ident not in mapped:
+                self.pprint(
+                    'Warning: no episodes were mapped to the disc in {}; it '
+                    'was assumed to contain only extras'.format(source))
         self.do_map()
 
+    def filter_titles(self, titles):
+        """
+        Filters duplicate and "play all" titles from *titles*.
+
+        Duplicate titles are excluded according to the 'duplicates'
+        configuration. Titles which contain several other titles (typically
+        "play all" titles) are always excluded; they can still be mapped
+        manually.
+        """
+        return [
+            title for title in titles
+            if not title.contains and (
+                title.duplicate == 'no' or
+                self.config.duplicates == 'all' or
+                self.config.duplicates == title.duplicate)
+            ]
+
+    def runtimes(self, min_samples=3):
+        """
+        Returns the runtimes of previously ripped episodes.
+
+        The runtimes of ripped episodes in the current season are returned if
+        there are at least *min_samples* of them, otherwise the runtimes of all
+        ripped episodes in the current program are returned.
+        """
+        if not self.config.season:
+            return []
+        query = self.session.query(
+                Episode._duration
+            ).filter(
+                (Episode.program_name == self.config.program_name) &
+                (Episode._duration != None)
+            )
+        result = [
+            timedelta(seconds=duration) for (duration,) in query.filter(
+                Episode.season_number == self.config.season_number)
+            ]
+        if len(result) < min_samples:
+            result = [timedelta(seconds=duration) for (duration,) in query]
+        return result
+
     def choose_mapping(self, mappings):
-        self.pprint('{} possible chapter-based mappings found'.format(len(mappings)))
+        self.pprint('{} possible mappings found'.format(len(mappings)))
+
+        # Box-set mappings may include whole titles; these are treated as
+        # their own "starting chapter"
+        def start(target):
+            if isinstance(target, Title):
+                return target
+            return target[0]
+
+        def label(start):
+            if isinstance(start, Title):
+                return '{}'.format(start.number)
+            return '{title}.{chapter:02d}'.format(
+                title=start.title.number, chapter=start.number)
+
         # Iterate over the episodes and ask the user in each case whether the
         # first chapter is accurate by playing a clip with vlc
         for episode in list(mappings[0].keys()):
-            chapters = set(mapping[episode][0] for mapping in mappings)
+            chapters = set(start(mapping[episode]) for mapping in mappings)
             self.pprint(
                 'Episode {episode} has {count} potential starting '
                 'chapters: {chapters}'.format(
                     episode=episode.number,
                     count=len(chapters),
-                    chapters=','.join(
-                        '{title}.{chapter:02d}'.format(
-                            title=chapter.title.number, chapter=chapter.number)
-                        for chapter in chapters)))
+                    chapters=','.join(label(chapter) for chapter in chapters)))
             while len(chapters) > 1:
                 chapter = chapters.pop()
                 while True:
                     chapter.play(self.config)
                     while True:
                         response = self.input(
-                            'Is chapter {title}.{chapter:02d} the start of episode '
+                            'Is chapter {chapter} the start of episode '
                             '{episode}? [y/n/r] '.format(
-                                title=chapter.title.number,
-                                chapter=chapter.number,
+                                chapter=label(chapter),
                                 episode=episode.number))
                         response = response.lower()[:1]
                         if response in ('y', 'n', 'r'):
@@ -1431,7 +2023,7 @@ class RipCmd(Cmd):
             chapter = chapters.pop()
             mappings = [
                 mapping for mapping in mappings
-                if mapping[episode][0] == chapter
+                if start(mapping[episode]) == chapter
                 ]
         assert len(mappings) == 1
         return mappings[0]
@@ -1502,15 +2094,7 @@ class RipCmd(Cmd):
                 'Mapping chapters {index} (duration {duration}) '
                 'to episode {episode_num}, "{episode_title}"'.format(
                     index=index,
-                    duration=sum((
-                        chapter.duration
-                        for title in start.title.disc.titles
-                        for chapter in title.chapters
-                        if (
-                            (start.title.number, start.number) <=
-                            (title.number, chapter.number) <=
-                            (end.title.number, end.number))
-                        ), timedelta()),
+                    duration=duration(target),
                     episode_num=episode.number,
                     episode_title=episode.name))
             self.episode_map[episode] = (start, end)
@@ -1519,12 +2103,20 @@ class RipCmd(Cmd):
         self.pprint('Episode Mapping (* indicates ripped):')
         self.pprint('')
         if self.episode_map:
+            # Maps produced by the boxset command may cover several discs in
+            # which case the source of each title is shown too
+            sources = {
+                (mapping if isinstance(mapping, Title) else mapping[0].title).disc.source
+                for mapping in self.episode_map.values()
+                }
             for episode, mapping in self.episode_map.items():
                 if isinstance(mapping, Title):
                     index = '{}'.format(mapping.number)
-                    duration = str(mapping.duration)
+                    runtime = str(mapping.duration)
+                    source = mapping.disc.source
                 else:
                     start, end = mapping
+                    source = start.title.disc.source
                     if start.title == end.title:
                         index = (
                             '{title}.{start:02d}-{end:02d}'.format(
@@ -1542,25 +2134,19 @@ class RipCmd(Cmd):
                                 ec=end.number
                             )
                         )
-                    duration = sum((
-                        chapter.duration
-                        for title in start.title.disc.titles
-                        for chapter in title.chapters
-                        if (
-                            (start.title.number, start.number) <=
-                            (title.number, chapter.number) <=
-                            (end.title.number, end.number))
-                        ), timedelta())
+                    runtime = str(duration(mapping))
                 self.pprint(
                     '{ripped:2s}title {title:<11s} ({duration}) = '
                     'episode {episode_num:2d}, '
                     '"{episode_title}"'.format(
                         ripped='*' if episode.ripped else ' ',
                         title=index,
-                        duration=duration,
+                        duration=runtime,
                         episode_num=episode.number,
                         episode_title=episode.name
                         ))
+                if len(sources) > 1:
+                    self.pprint('    from {}'.format(source))
         else:
             self.pprint('Episode map is currently empty')
 
@@ -1595,11 +2181,103 @@ class RipCmd(Cmd):
                 '{episode.name}'.format(episode=episode))
             try:
                 del self.episode_map[episode]
+                self.unmapped.add(self.map_key(episode))
             except KeyError:
                 self.pprint(
                     'Episode {episode.number}, {episode.name} was not in the '
                     'map'.format(episode=episode))
 
+    def do_benchmark(self, arg=''):
+        """
+        Measures the speed of encoder presets on this machine.
+
+        Syntax: benchmark [title [presets [threads]]]
+
+        The 'benchmark' command encodes a one minute sample from the middle
+        of the specified title (or the longest title if none is given) of the
+        scanned disc or disc image with each combination of the specified
+        x264 presets and thread counts. It then reports the frame rate
+        achieved, the size of the output (extrapolated to an hour of video),
+        and the CPU utilisation of the encoder. The presets and thread counts
+        are comma-separated lists which default to "faster,fast,medium,slow"
+        and "0" (automatic) respectively. The measured rates are stored for
+        estimating encoding times. For example:
+
+        (tvrip) benchmark
+        (tvrip) benchmark 3 veryfast,medium,slow
+        (tvrip) benchmark 3 medium 1,2,4
+
+        Use the 'preset' command to select the preset used for ripping.
+
+        See also: preset, scan
+        """
+        if not self.disc:
+            raise CmdError('No disc has been scanned yet')
+        elif not self.disc.titles:
+            raise CmdError('No titles found on the scanned disc')
+        args = arg.split()
+        if len(args) > 3:
+            raise CmdSyntaxError('Too many arguments')
+        if args:
+            title = self.parse_title(args[0])
+        else:
+            title = max(self.disc.titles, key=attrgetter('duration'))
+        if len(args) > 1:
+            presets = args[1].lower().split(',')
+        else:
+            presets = ['faster', 'fast', 'medium', 'slow']
+        for preset in presets:
+            if preset not in ENCODER_PRESETS:
+                raise CmdSyntaxError(
+                    'Invalid encoder preset {}'.format(preset))
+        if len(args) > 2:
+            threads = self.parse_number_list(args[2])
+        else:
+            threads = [0]
+        if not title.frame_rate:
+            raise CmdError(
+                'Unable to determine the frame rate of title {}'.format(
+                    title.number))
+        seconds = int(title.duration.total_seconds())
+        length = min(60, seconds)
+        if not length:
+            raise CmdError('Title {} is empty'.format(title.number))
+        start = (seconds - length) // 2
+        frames = length * title.frame_rate
+        table = [('Preset', 'Threads', 'FPS', 'MB/hour', 'CPU')]
+        tmphandle, tmpfile = tempfile.mkstemp(
+            suffix='.mp4', dir=self.config.temp)
+        os.close(tmphandle)
+        try:
+            for preset in presets:
+                for thread_count in threads:
+                    self.pprint(
+                        'Encoding sample of title {title} with preset '
+                        '{preset}, {threads} threads'.format(
+                            title=title.number, preset=preset,
+                            threads=thread_count or 'auto'))
+                    try:
+                        elapsed, size, cpu = self.disc.encode_sample(
+                            self.config, title, tmpfile, start, length,
+                            preset, thread_count)
+                    except proc.CalledProcessError as e:
+                        raise CmdError(
+                            'process failed with code {}'.format(e.returncode))
+                    fps = frames / elapsed
+                    bitrate = int(size * 8 / length)
+                    self.config.set_rate(preset, thread_count, fps, bitrate)
+                    table.append((
+                        preset,
+                        thread_count or 'auto',
+                        '{:.1f}'.format(fps),
+                        '{:.0f}'.format(bitrate * 3600 / 8 / 1000000),
+                        '{:.0f}%'.format(cpu * 100),
+                        ))
+        finally:
+            os.unlink(tmpfile)
+        self.pprint('')
+        self.pprint_table(table)
+
     def do_rip(self, arg=''):
         """
         Starts the ripping and transcoding process.
@@ -1615,15 +2293,22 @@ class RipCmd(Cmd):
         You can specify a list of episodes to rip only a subset of the map.
         This is useful to adjust ripping configurations between episodes. Note
         that already ripped episodes will not be re-ripped even if manually
-        specified. Use 'unrip' first.
+        specified. Use 'unrip' first. Episodes mapped to titles which contain
+        several other titles (such as "play all" titles) are only ripped when
+        specified.
 
         If no episodes are specified, all unripped episodes in the map will be
-        ripped. Examples:
+        ripped. If a deadline has been set with the 'deadline' command, the
+        encoder preset is chosen before each episode to meet it. The space
+        required by each episode is estimated before it is ripped; episodes
+        which will not fit in the target and temp paths are deferred.
+        Episodes are ripped in (approximately) the order their titles and
+        chapters are laid out on the disc, to reduce seeking. Examples:
 
         (tvrip) rip
         (tvrip) rip 8,11-15
 
-        See also: unrip, map, automap
+        See also: unrip, map, automap, deadline
         """
         if not self.episode_map:
             raise CmdError('No titles have been mapped to episodes')
@@ -1631,22 +2316,195 @@ class RipCmd(Cmd):
         if arg:
             episodes = self.parse_episode_list(arg, must_exist=False)
         else:
-            episodes = self.episode_map.keys()
-        for episode in episodes:
+            episodes = []
+            for episode, target in self.episode_map.items():
+                title = target if isinstance(target, Title) else target[0].title
+                if title.contains and not episode.ripped:
+                    self.pprint(
+                        'Skipping episode {episode}; title {title} contains '
+                        'the content of other titles (specify the episode '
+                        'to rip it anyway)'.format(
+                            episode=episode.number, title=title.number))
+                else:
+                    episodes.append(episode)
+        # Rip in (approximate) order of position on the disc(s) so the drive
+        # mostly reads forwards instead of seeking back and forth
+        episodes = sorted(episodes, key=self.rip_position)
+        self.verify_discs(episodes)
+        history = self.sizes()
+        target_free, temp_free, shared = self.free_space()
+        targets = {
+            self.episode_map[episode]
+            for episode in episodes
+            if not episode.ripped and episode in self.episode_map
+            }
+        self.pprint(
+            'Projected space required: {required}; {free} free in '
+            '{target}'.format(
+                required=estimate.format_size(sum(
+                    self.rip_size(target, history=history)
+                    for target in targets)),
+                free=estimate.format_size(target_free),
+                target=self.config.target))
+        deferred = []
+        encoded = {}
+        for index, episode in enumerate(episodes):
             if not episode.ripped:
-                self._rip_episode(episode)
+                # Re-check the deadline (if any) before each job as the
+                # estimate changes as jobs finish (early or late)
+                preset, threads = self.deadline_preset(episodes[index:])
+                if self.check_space(episode, preset, threads, history):
+                    self._rip_episode(episode, preset, threads, encoded)
+                    # Record each rip as it completes so that the work isn't
+                    # lost if a later job fails, and so that other instances
+                    # sharing the database see it promptly
+                    self.session.commit()
+                else:
+                    deferred.append(episode)
+        if deferred:
+            self.pprint(
+                'Warning: deferred episodes {} due to insufficient '
+                'space'.format(','.join(str(e.number) for e in deferred)))
 
-    def _rip_episode(self, episode):
-        mapping = self.episode_map[episode]
-        if isinstance(mapping, Title):
-            chapter_start = chapter_end = None
-            title = mapping
-            episodes = [e for e, t in self.episode_map.items() if t is title]
+    def verify_discs(self, episodes):
+        """
+        Checks the drives of the discs mapped to *episodes* still contain them.
+
+        Discs restored from the catalog at startup may have been swapped since,
+        so the disc in the current source is re-scanned and its identifier
+        compared before anything is ripped from it. Other restored drives must
+        be scanned by the operator.
+        """
+        discs = {}
+        for episode in episodes:
+            target = self.episode_map.get(episode)
+            if target is not None and not episode.ripped:
+                disc = (
+                    target.disc if isinstance(target, Title) else
+                    target[0].title.disc)
+                discs[disc.source] = disc
+        for source, disc in discs.items():
+            if source not in self.unverified:
+                continue
+            if source != self.config.source:
+                raise CmdError(
+                    'The disc in {} was restored from the catalog; scan it '
+                    'before ripping'.format(source))
+            self.pprint('Verifying the disc in {}'.format(source))
+            try:
+                scanned = Disc(self.config)
+            except (IOError, proc.CalledProcessError) as exc:
+                raise CmdError(exc)
+            if scanned.ident != disc.ident:
+                raise CmdError(
+                    'The disc in {} is not the one mapped; scan it before '
+                    'ripping'.format(source))
+            self.unverified.discard(source)
+
+    def rip_position(self, episode):
+        "Returns a key ordering *episode* by the disc position of its mapping"
+        try:
+            target = self.episode_map[episode]
+        except KeyError:
+            return ('',)
+        start = target if isinstance(target, Title) else target[0]
+        disc = target.disc if isinstance(target, Title) else start.title.disc
+        return (str(disc.source),) + start.position
+
+    def sizes(self, min_samples=3):
+        """
+        Returns the sizes, runtimes, and presets of previously encoded
+        episodes.
+
+        As with :meth:`runtimes`, the history of the current season is
+        returned if it has at least *min_samples* entries, otherwise that of
+        the current program. Remuxed episodes, and those ripped before presets
+        were recorded, are excluded as their sizes say nothing of the encoder.
+        """
+        if not self.config.season:
+            return []
+        query = self.session.query(
+                Episode.size, Episode._duration, Episode.preset
+            ).filter(
+                (Episode.program_name == self.config.program_name) &
+                (Episode.size != None) &
+                (Episode._duration != None) &
+                (Episode.preset != None) &
+                (Episode.preset != 'remux')
+            )
+        result = [
+            (size, timedelta(seconds=duration), preset)
+            for (size, duration, preset) in query.filter(
+                Episode.season_number == self.config.season_number)
+            ]
+        if len(result) < min_samples:
+            result = [
+                (size, timedelta(seconds=duration), preset)
+                for (size, duration, preset) in query
+                ]
+        return result
+
+    def rip_size(self, target, preset=None, threads=None, history=None):
+        "Returns the estimated size of ripping the mapping *target*"
+        if self.config.remux:
+            return estimate.remux_size(target)
+        title = target if isinstance(target, Title) else target[0].title
+        audio_tracks, subtitle_tracks = self.select_tracks(title)
+        return estimate.size(target, estimate.bytes_per_second(
+            self.config, len(audio_tracks), preset, threads, history))
+
+    def free_space(self):
+        """
+        Returns the free space in the target and temp paths, and whether they
+        share a file-system.
+        """
+        try:
+            target_free = shutil.disk_usage(self.config.target).free
+            temp_free = shutil.disk_usage(self.config.temp).free
+            shared = (
+                os.stat(self.config.target).st_dev ==
+                os.stat(self.config.temp).st_dev)
+        except OSError as exc:
+            raise CmdError(exc)
+        return target_free, temp_free, shared
+
+    def check_space(self, episode, preset=None, threads=None, history=None):
+        """
+        Returns True if there is space to rip *episode*.
+
+        The encoded output is written to the target path, then copied to the
+        temp path while it is tagged, so room for the estimated output is
+        required in both (or twice over if they share a file-system).
+        """
+        required = self.rip_size(
+            self.episode_map[episode], preset, threads, history)
+        target_free, temp_free, shared = self.free_space()
+        if shared:
+            if target_free < required * 2:
+                self.pprint(
+                    'Deferring episode {episode}: requires {required} in '
+                    '{target} but only {free} is free'.format(
+                        episode=episode.number,
+                        required=estimate.format_size(required * 2),
+                        target=self.config.target,
+                        free=estimate.format_size(target_free)))
+                return False
         else:
-            chapter_start, chapter_end = mapping
-            assert chapter_start.title is chapter_end.title
-            title = chapter_start.title
-            episodes = [episode]
+            for path, free in (
+                    (self.config.target, target_free),
+                    (self.config.temp, temp_free)):
+                if free < required:
+                    self.pprint(
+                        'Deferring episode {episode}: requires {required} '
+                        'in {path} but only {free} is free'.format(
+                            episode=episode.number,
+                            required=estimate.format_size(required),
+                            path=path, free=estimate.format_size(free)))
+                    return False
+        return True
+
+    def select_tracks(self, title):
+        "Returns the audio and subtitle tracks of *title* to rip"
         audio_tracks = [
             t for t in title.audio_tracks
             if self.config.in_audio_langs(t.language)
@@ -1662,6 +2520,86 @@ class RipCmd(Cmd):
         ]
         if not self.config.subtitle_all:
             subtitle_tracks = [t for t in subtitle_tracks if t.best]
+        return audio_tracks, subtitle_tracks
+
+    def deadline_preset(self, episodes):
+        """
+        Returns the encoder preset and threads to rip *episodes* by the
+        deadline.
+
+        If no deadline is set, or no encoder rates have been measured, the
+        result is (None, None) indicating the configured preset should be
+        used.
+        """
+        if not self.config.deadline:
+            return None, None
+        targets = {
+            self.episode_map[episode]
+            for episode in episodes
+            if not episode.ripped and episode in self.episode_map
+            }
+        work = estimate.frames(targets)
+        remaining = (self.config.deadline - datetime.now()).total_seconds()
+        rate = estimate.choose_preset(self.config.rates, work, remaining)
+        if rate is None:
+            self.pprint(
+                'Warning: no encoder speeds have been measured; use the '
+                'benchmark command to enable deadline scheduling')
+            return None, None
+        estimated = timedelta(seconds=int(work / rate.fps))
+        if estimated.total_seconds() > remaining:
+            self.pprint(
+                'Warning: the deadline cannot be met; estimated {estimated} '
+                'with preset {preset}'.format(
+                    estimated=estimated, preset=rate.preset))
+        else:
+            self.pprint(
+                'Using preset {preset}; estimated {estimated} to complete '
+                'remaining rips'.format(
+                    estimated=estimated, preset=rate.preset))
+        return rate.preset, rate.threads
+
+    def rip_key(self, target, audio_tracks, subtitle_tracks):
+        """
+        Returns a key identifying the encode of *target* with the specified
+        tracks.
+
+        Targets with identical content (the same title or chapters, or the
+        same chapters of titles with equal signatures) on the same disc have
+        equal keys. Titles on different discs of a box set frequently share a
+        chapter layout, hence the disc is part of the key.
+        """
+        if isinstance(target, Title):
+            content = (target.disc.ident, target.signature)
+        else:
+            start, end = target
+            content = (
+                start.title.disc.ident, start.title.signature,
+                start.title_index(), end.title_index())
+        return (
+            content,
+            tuple((track.number, track.name) for track in audio_tracks),
+            tuple(track.number for track in subtitle_tracks),
+            )
+
+    def _rip_episode(self, episode, preset=None, threads=None, encoded=None):
+        mapping = self.episode_map[episode]
+        if isinstance(mapping, Title):
+            chapter_start = chapter_end = None
+            title = mapping
+            episodes = self.episode_map.episodes(title)
+        else:
+            chapter_start, chapter_end = mapping
+            assert chapter_start.title is chapter_end.title
+            title = chapter_start.title
+            episodes = [episode]
+        audio_tracks, subtitle_tracks = self.select_tracks(title)
+        if encoded is None:
+            encoded = {}
+        key = self.rip_key(mapping, audio_tracks, subtitle_tracks)
+        source = encoded.get(key)
+        if source is not None and not os.path.exists(source):
+            source = None
         if len(episodes) == 1:
             self.pprint(
                 'Ripping episode {episode.number}, '
@@ -1674,11 +2612,65 @@ class RipCmd(Cmd):
                     title=multipart.name(episodes)
                 )
             )
+        if source is not None:
+            self.pprint('Re-using the identical encode {}'.format(
+                os.path.basename(source)))
         try:
-            self.disc.rip(self.config, episodes, title, audio_tracks,
-                          subtitle_tracks, chapter_start, chapter_end)
+            encoded.setdefault(key, title.disc.rip(
+                self.config, episodes, title, audio_tracks, subtitle_tracks,
+                chapter_start, chapter_end, preset, threads, source))
         except proc.CalledProcessError as e:
             raise CmdError('process failed with code {}'.format(e.returncode))
+        self.record_catalog(title.disc)
+
+    def do_deadline(self, arg=''):
+        """
+        Sets a deadline for completing rips.
+
+        Syntax: deadline [off | [date] time]
+
+        The 'deadline' command sets the time by which the 'rip' command should
+        finish. While a deadline is set, before each episode is ripped the
+        remaining encoding work is estimated from the durations of the
+        episodes left to rip and the encoder speeds measured by the
+        'benchmark' command. The slowest (and thus most efficient) preset
+        which can still meet the deadline is then used in place of the
+        preset configured for the video style. If no date is given, the
+        deadline is the next occurrence of the time. Specify 'off' to remove
+        the deadline. Without arguments, the current deadline is shown along
+        with the estimate for the mapped episodes. For example:
+
+        (tvrip) deadline 18:00
+        (tvrip) deadline 2017-03-01 09:30
+        (tvrip) deadline off
+
+        See also: benchmark, preset, rip
+        """
+        arg = arg.strip()
+        if arg.lower() == 'off':
+            self.config.deadline = None
+        elif arg:
+            now = datetime.now()
+            try:
+                deadline = datetime.strptime(arg, '%Y-%m-%d %H:%M')
+            except ValueError:
+                try:
+                    deadline = datetime.combine(
+                        now.date(), datetime.strptime(arg, '%H:%M').time())
+                except ValueError:
+                    raise CmdSyntaxError('Invalid deadline {}'.format(arg))
+                if deadline <= now:
+                    deadline += timedelta(days=1)
+            if deadline <= now:
+                raise CmdError('The deadline {} has passed'.format(deadline))
+            self.config.deadline = deadline
+        elif not self.config.deadline:
+            self.pprint('No deadline has been set')
+        else:
+            self.pprint('Deadline: {}'.format(
+                self.config.deadline.strftime('%Y-%m-%d %H:%M')))
+            if self.episode_map:
+                self.deadline_preset(self.episode_map.keys())
 
     def do_unrip(self, arg):
         """
@@ -1704,22 +2696,42 @@ class RipCmd(Cmd):
         if not arg:
             raise CmdSyntaxError(
                 'You must specify a list of episodes to mark as unripped')
-        episodes = arg
-        if episodes == '*':
-            episodes = self.session.query(
+        # The runtime, size, and preset go too; an episode is usually unripped
+        # because it was mapped wrongly, and they would skew the history used
+        # by automap and the space estimates
+        unripped = {
+            Episode.disc_id: None,
+            Episode.disc_title: None,
+            Episode.start_chapter: None,
+            Episode.end_chapter: None,
+            Episode._duration: None,
+            Episode.size: None,
+            Episode.preset: None,
+            }
+        if arg == '*':
+            if not self.config.season:
+                raise CmdError('No season has been set')
+            self.session.query(
                     Episode
                 ).filter(
-                    (Episode.season == self.config.season) &
+                    (Episode.program_name == self.config.program_name) &
+                    (Episode.season_number == self.config.season_number) &
                     (Episode.disc_id != None)
-                )
+                ).update(unripped, synchronize_session='evaluate')
         else:
-            episodes = self.parse_episode_list(episodes, must_exist=False)
-        for episode in episodes:
-            if episode:
-                episode.disc_id = None
-                episode.disc_title = None
-                episode.start_chapter = None
-                episode.end_chapter = None
+            numbers = [
+                episode.number
+                for episode in self.parse_episode_list(arg, must_exist=False)
+                if episode
+                ]
+            if numbers:
+                self.session.query(
+                        Episode
+                    ).filter(
+                        (Episode.program_name == self.config.program_name) &
+                        (Episode.season_number == self.config.season_number) &
+                        (Episode.number.in_(numbers))
+                    ).update(unripped, synchronize_session='evaluate')
 
     def do_source(self, arg):
         """
@@ -20,13 +20,15 @@
 
 import os
 import re
+import time
 import shutil
 import tempfile
 import datetime as dt
 import subprocess as proc
 import hashlib
+from array import array
 from operator import attrgetter
-from itertools import groupby
+from itertools import groupby, accumulate
 from weakref import proxy
 
 from . import multipart
@@ -41,6 +43,19 @@ AUDIO_MIX_ORDER = [
     '1.0 ch',
     ]
 AUDIO_ENCODING_ORDER = ['DTS', 'AC3']
+# x264's presets, from fastest to slowest
+ENCODER_PRESETS = [
+    'ultrafast',
+    'superfast',
+    'veryfast',
+    'faster',
+    'fast',
+    'medium',
+    'slow',
+    'slower',
+    'veryslow',
+    'placebo',
+    ]
 
 
 class Disc():
@@ -55,6 +70,10 @@ class Disc():
         r'^libdvdnav: DVD Serial Number: (?P<serial>.*)$', re.UNICODE)
     title_re = re.compile(
         r'^\+ title (?P<number>\d+):$', re.UNICODE)
+    vts_re = re.compile(
+        r'^  \+ vts (?P<vts>\d+), ttn (?P<ttn>\d+), '
+        r'cells (?P<first_cell>\d+)->(?P<last_cell>\d+) '
+        r'\((?P<blocks>\d+) blocks\)$', re.UNICODE)
     duration_re = re.compile(
         r'^  \+ duration: (?P<duration>.*)$', re.UNICODE)
     stats_re = re.compile(
@@ -64,7 +83,9 @@ class Disc():
     comb_re = re.compile(r'^  \+ combing detected,.*$', re.UNICODE)
     chapters_re = re.compile(r'^  \+ chapters:$', re.UNICODE)
     chapter_re = re.compile(
-        r'^    \+ (?P<number>\d+): cells \d+->\d+, \d+ blocks, '
+        r'^    \+ (?P<number>\d+): '
+        r'cells (?P<first_cell>\d+)->(?P<last_cell>\d+), '
+        r'(?P<blocks>\d+) blocks, '
         r'duration (?P<duration>.*)$', re.UNICODE)
     audio_tracks_re = re.compile(r'^  \+ audio tracks:$', re.UNICODE)
     audio_track_re = re.compile(
@@ -83,19 +104,73 @@ class Disc():
 
     def __init__(self, config, titles=None):
         super().__init__()
+        self._reset(config.source)
+        if titles is None:
+            titles = [0]
+        for title in titles:
+            self._scan_title(config, title)
+        self._finalize()
+
+    @classmethod
+    def from_output(cls, outputs, source=None):
+        """
+        Constructs a Disc from previously captured HandBrake scan output.
+
+        The *outputs* parameter is a sequence of strings, each containing the
+        output of a HandBrakeCLI scan (as would be produced for each title
+        scanned). This permits the parser to be exercised without a drive.
+        """
+        disc = cls.__new__(cls)
+        disc._reset(source)
+        for output in outputs:
+            disc._parse_scan(output)
+        disc._finalize()
+        return disc
+
+    def _reset(self, source):
         self.match = None
         self.titles = []
         self.name = ''
         self.serial = None
         self.ident = None
-        if titles is None:
-            titles = [0]
-        for title in titles:
-            self._scan_title(config, title)
+        self.source = source
+        self.outputs = []
+        self._title_numbers = {}
+
+    def _finalize(self):
+        self.index_titles()
+        for title in self.titles:
+            title.build_timeline()
+            title.audio_tracks = sorted(
+                title.audio_tracks, key=attrgetter('number'))
+            title.subtitle_tracks = sorted(
+                title.subtitle_tracks, key=attrgetter('number'))
         self.ident = self._generate_ident()
         self._mark_duplicates()
+        self._mark_supersets()
         self._mark_best()
 
+    def index_titles(self):
+        """
+        Records the position of each title within the disc.
+
+        The positions make Title.previous and Title.next constant-time. This
+        is called after scanning, and automatically by those properties if the
+        titles list has been altered since.
+        """
+        self._title_numbers = {}
+        for index, title in enumerate(self.titles):
+            title.index = index
+            self._title_numbers.setdefault(title.number, title)
+
+    def get_title(self, number):
+        "Returns the title with the specified number or None"
+        title = self._title_numbers.get(number)
+        if title is None or title.disc_index() is None:
+            self.index_titles()
+            title = self._title_numbers.get(number)
+        return title
+
     def _generate_ident(self):
         # Calculate a hash of disc serial, and track properties to form a
         # unique disc identifier, then replace disc-serial with this (#1)
@@ -133,6 +208,35 @@ class Disc():
         if title.duplicate == 'yes':
             title.duplicate = 'last'
 
+    def _mark_supersets(self):
+        # Mark titles which contain the content of several other titles (such
+        # as the "play all" title found on many discs). A title contains
+        # another if the other's chapter signatures (durations and sizes)
+        # appear as a contiguous run within its own. To avoid coincidental
+        # matches, a title is only marked if it contains at least two other
+        # titles at distinct, non-overlapping positions; Title.contains is
+        # then the list of the titles contained
+        signatures = {
+            title: title.signature for title in self.titles if title.chapters}
+        for title, signature in signatures.items():
+            starts = {}
+            for index, chapter in enumerate(signature):
+                starts.setdefault(chapter, []).append(index)
+            found = []
+            for other, other_sig in signatures.items():
+                if other is title or len(other_sig) >= len(signature):
+                    continue
+                for start in starts.get(other_sig[0], ()):
+                    if signature[start:start + len(other_sig)] == other_sig:
+                        found.append((start, start + len(other_sig), other))
+                        break
+            spans = []
+            for start, finish, other in sorted(found, key=lambda f: f[:2]):
+                if not spans or start >= spans[-1][1]:
+                    spans.append((start, finish))
+            if len(spans) > 1:
+                title.contains = [other for start, finish, other in found]
+
     def _mark_best(self):
         # Mark "best" audio and subtitle tracks for each language; the "best"
         # audio track is determined by the global AUDIO_MIX_ORDER and
@@ -160,14 +264,6 @@ class Disc():
 
     def _scan_title(self, config, title):
         "Internal method for scanning (a) disc title(s)"
-
-        # This is a simple utility method to make the pattern matching below a
-        # bit simpler. It returns the result of the match as a bool and stores
-        # the result as an instance attribute for later extraction of groups
-        def _match(pattern, line):
-            self.match = pattern.match(line)
-            return bool(self.match)
-
         cmdline = [
             config.get_path('handbrake'),
             '-i', config.source,      # specify the input device
@@ -180,6 +276,19 @@ class Disc():
         output = proc.check_output(
             cmdline, stderr=proc.STDOUT, universal_newlines=True,
             errors='replace')
+        self._parse_scan(output)
+
+    def _parse_scan(self, output):
+        "Internal method for parsing the output of a HandBrake scan"
+        self.outputs.append(output)
+
+        # This is a simple utility method to make the pattern matching below a
+        # bit simpler. It returns the result of the match as a bool and stores
+        # the result as an instance attribute for later extraction of groups
+        def _match(pattern, line):
+            self.match = pattern.match(line)
+            return bool(self.match)
+
         state = {'disc'}
         title = None
         # Parse the output into child objects
@@ -188,22 +297,22 @@ class Disc():
                     _match(self.error1_re, line) or
                     _match(self.error2_re, line)):
                 raise IOError(
-                    'Unable to read disc in {}'.format(config.source))
+                    'Unable to read disc in {}'.format(self.source))
             if 'disc' in state and _match(self.disc_name_re, line):
                 self.name = self.match.group('name')
             elif 'disc' in state and _match(self.disc_serial_re, line):
                 self.serial = str(self.match.group('serial'))
             elif 'disc' in state and _match(self.title_re, line):
-                if title:
-                    title.chapters = sorted(
-                        title.chapters, key=attrgetter('number'))
-                    title.audio_tracks = sorted(
-                        title.audio_tracks, key=attrgetter('number'))
-                    title.subtitle_tracks = sorted(
-                        title.subtitle_tracks, key=attrgetter('number'))
                 state = {'disc', 'title'}
                 title = Title(self)
                 title.number = int(self.match.group('number'))
+            elif 'title' in state and _match(self.vts_re, line):
+                state = {'disc', 'title'}
+                title.vts = int(self.match.group('vts'))
+                title.ttn = int(self.match.group('ttn'))
+                title.first_cell = int(self.match.group('first_cell'))
+                title.last_cell = int(self.match.group('last_cell'))
+                title.blocks = int(self.match.group('blocks'))
             elif 'title' in state and _match(self.duration_re, line):
                 state = {'disc', 'title'}
                 hours, minutes, seconds = (
@@ -227,6 +336,9 @@ class Disc():
             elif 'chapter' in state and _match(self.chapter_re, line):
                 chapter = Chapter(title)
                 chapter.number = int(self.match.group('number'))
+                chapter.first_cell = int(self.match.group('first_cell'))
+                chapter.last_cell = int(self.match.group('last_cell'))
+                chapter.blocks = int(self.match.group('blocks'))
                 hours, minutes, seconds = (
                     int(i) for i in self.match.group('duration').split(':'))
                 chapter.duration = dt.timedelta(
@@ -264,35 +376,30 @@ class Disc():
         "Play the specified title or chapter"
         if isinstance(title_or_chapter, Title):
             mrl = 'dvd://{source}#{title}'.format(
-                source=config.source,
+                source=self.source,
                 title=title_or_chapter.number)
         elif isinstance(title_or_chapter, Chapter):
             mrl = 'dvd://{source}#{title}:{chapter}'.format(
-                source=config.source,
+                source=self.source,
                 title=title_or_chapter.title.number,
                 chapter=title_or_chapter.number)
         cmdline = [config.get_path('vlc'), '--quiet', mrl]
         proc.check_call(cmdline, stdout=proc.DEVNULL, stderr=proc.DEVNULL)
 
-    def rip(self, config, episodes, title, audio_tracks, subtitle_tracks,
-            start_chapter=None, end_chapter=None):
-        "Rip the specified title"
-        file_id = ' '.join(
-            config.id_template.format(
-                season=episode.season.number,
-                episode=episode.number
-            )
-            for episode in sorted(episodes, key=attrgetter('number'))
-        )
-        filename = config.template.format(
-            program=config.program.name,
-            id=file_id,
-            name=multipart.name(episodes),
-            now=dt.datetime.now(),
-            )
-        # Replace invalid characters in the filename with -
-        filename = re.sub(r'[\/:]', '-', filename)
-        # Convert the video track
+    def encode_cmdline(self, config, title, output, audio_tracks,
+                       subtitle_tracks, start_chapter=None, end_chapter=None,
+                       preset=None, threads=None):
+        """
+        Returns the HandBrake command line for encoding the specified title.
+
+        The *preset* and *threads* (0 meaning automatic) of the x264 encoder
+        default to those preferred for the configured video_style. If
+        *audio_tracks* is empty, the output will have no audio.
+        """
+        if preset is None:
+            preset, default_threads = config.get_preset()
+            if threads is None:
+                threads = default_threads
         audio_defs = [
             (track.number, config.audio_mix, track.name)
             for track in audio_tracks
@@ -303,18 +410,19 @@ class Disc():
             ]
         cmdline = [
             config.get_path('handbrake'),
-            '-i', config.source,
+            '-i', self.source,
             '-t', str(title.number),
-            '-o', os.path.join(config.target, filename),
+            '-o', output,
             '-f', 'av_mp4',  # output an MP4 container
             '-O',            # optimize for streaming
             '-m',            # include chapter markers
             '--encoder', 'x264',
-            '--encoder-preset', 'medium',
+            '--encoder-preset', preset,
             '--encoder-profile', 'high',
             '--encoder-level', '4.1',
             # advanced encoding options (mostly defaults from High Profile)
-            '-x', 'psy-rd=1|0.15:vbv-bufsize=78125:vbv-maxrate=62500:me=umh:b-adapt=2',
+            '-x', 'psy-rd=1|0.15:vbv-bufsize=78125:vbv-maxrate=62500:me=umh:b-adapt=2' +
+            (':threads={}'.format(threads) if threads else ''),
             # disable cropping (otherwise vobsub subtitles screw up) but don't
             # sacrifice cropping for aligned storage
             '--crop', '0:0:0:0',
@@ -323,14 +431,19 @@ class Disc():
             # explicitly specifying them)
             '--loose-anamorphic',
             '--modulus', '16',
-            # audio encoding options (use 160kbps FDK-AAC plus whatever downmix
-            # the user selected for the specified tracks)
-            '-a', ','.join(str(num)  for (num, _, _)  in audio_defs),
-            '-E', ','.join('fdk_aac' for ad           in audio_defs),
-            '-B', ','.join('160'     for ad           in audio_defs),
-            '-6', ','.join(mix       for (_, mix, _)  in audio_defs),
-            '-A', ','.join(name      for (_, _, name) in audio_defs),
             ]
+        if audio_defs:
+            cmdline.extend([
+                # audio encoding options (use 160kbps FDK-AAC plus whatever
+                # downmix the user selected for the specified tracks)
+                '-a', ','.join(str(num)  for (num, _, _)  in audio_defs),
+                '-E', ','.join('fdk_aac' for ad           in audio_defs),
+                '-B', ','.join('160'     for ad           in audio_defs),
+                '-6', ','.join(mix       for (_, mix, _)  in audio_defs),
+                '-A', ','.join(name      for (_, _, name) in audio_defs),
+                ])
+        else:
+            cmdline.extend(['-a', 'none'])
         cmdline.append('--quality')
         cmdline.append(str({
             'film':      21,
@@ -350,7 +463,7 @@ class Disc():
                         start=start_chapter.number, end=end_chapter.number))
             else:
                 cmdline.append(str(start_chapter.number))
-        if config.subtitle_format == 'vobsub':
+        if config.subtitle_format == 'vobsub' and subtitle_defs:
             cmdline.append('-s')
             cmdline.append(','.join(str(num) for (num, _, _) in subtitle_defs))
             if config.subtitle_default:
@@ -364,13 +477,124 @@ class Disc():
             cmdline.append('slow')
         elif config.decomb == 'auto':
             cmdline.append('-5')
-        proc.check_call(cmdline)
+        return cmdline
+
+    def remux_cmdline(self, config, title, output, audio_tracks,
+                      subtitle_tracks, start_chapter=None, end_chapter=None):
+        """
+        Returns the command line for remuxing the specified title.
+
+        The video, and the selected audio and subtitle streams, are copied
+        untouched (with the title's chapters) into an MP4 container by the
+        configured remux utility (ffmpeg's dvdvideo demuxer).
+        """
+        cmdline = [
+            config.get_path('remux'),
+            '-nostdin',
+            '-y',
+            '-f', 'dvdvideo',
+            '-title', str(title.number),
+            ]
+        if start_chapter:
+            cmdline.extend([
+                '-chapter_start', str(start_chapter.number),
+                '-chapter_end', str((end_chapter or start_chapter).number),
+                ])
+        cmdline.extend([
+            '-i', self.source,
+            '-map', '0:v:0',
+            ])
+        # HandBrake numbers tracks from 1 in the order ffmpeg indexes streams
+        for track in audio_tracks:
+            cmdline.extend(['-map', '0:a:{}'.format(track.number - 1)])
+        if config.subtitle_format in ('vobsub', 'any'):
+            for track in subtitle_tracks:
+                if track.format == 'vobsub':
+                    cmdline.extend(
+                        ['-map', '0:s:{}'.format(track.number - 1)])
+        cmdline.extend([
+            '-map_chapters', '0',
+            '-c', 'copy',
+            '-f', 'mp4',
+            '-movflags', '+faststart',
+            output,
+            ])
+        return cmdline
+
+    def encode_sample(self, config, title, output, start, length,
+                      preset=None, threads=None):
+        """
+        Encodes a sample of the specified title for benchmarking.
+
+        The sample begins *start* seconds into *title* and lasts *length*
+        seconds (both integers), and is encoded (without audio or subtitles)
+        to *output*. Returns a tuple of the wall-clock time taken (in seconds),
+        the size of the output in bytes, and the CPU utilisation of the
+        encoder as a proportion of the machine's total capacity.
+        """
+        cmdline = self.encode_cmdline(
+            config, title, output, [], [], preset=preset, threads=threads)
+        cmdline.extend([
+            '--start-at', 'duration:{}'.format(start),
+            '--stop-at', 'duration:{}'.format(length),
+            ])
+        before_cpu = os.times()
+        before = time.monotonic()
+        proc.check_call(cmdline, stdout=proc.DEVNULL, stderr=proc.DEVNULL)
+        elapsed = time.monotonic() - before
+        after_cpu = os.times()
+        cpu = (
+            (after_cpu.children_user - before_cpu.children_user) +
+            (after_cpu.children_system - before_cpu.children_system)
+            ) / elapsed / (os.cpu_count() or 1)
+        return elapsed, os.path.getsize(output), cpu
+
+    def rip(self, config, episodes, title, audio_tracks, subtitle_tracks,
+            start_chapter=None, end_chapter=None, preset=None, threads=None,
+            encoded=None):
+        """
+        Rip the specified title.
+
+        If *encoded* is the filename of an existing encode of the same
+        selection (e.g. an identical duplicate title), it is re-tagged for
+        *episodes* instead of encoding the title again. Returns the filename
+        of the output.
+        """
+        file_id = ' '.join(
+            config.id_template.format(
+                season=episode.season.number,
+                episode=episode.number
+            )
+            for episode in sorted(episodes, key=attrgetter('number'))
+        )
+        filename = config.template.format(
+            program=config.program.name,
+            id=file_id,
+            name=multipart.name(episodes),
+            now=dt.datetime.now(),
+            )
+        # Replace invalid characters in the filename with -
+        filename = re.sub(r'[\/:]', '-', filename)
+        output = os.path.join(config.target, filename)
+        if encoded is None:
+            if config.remux:
+                # Copy the streams untouched
+                cmdline = self.remux_cmdline(
+                    config, title, output, audio_tracks, subtitle_tracks,
+                    start_chapter, end_chapter)
+            else:
+                # Convert the video track
+                cmdline = self.encode_cmdline(
+                    config, title, output, audio_tracks, subtitle_tracks,
+                    start_chapter, end_chapter, preset, threads)
+            proc.check_call(cmdline)
+            encoded = output
         # Tag the resulting file
         tmphandle, tmpfile = tempfile.mkstemp(dir=config.temp)
         try:
             cmdline = [
                 config.get_path('atomicparsley'),
-                os.path.join(config.target, filename),
+                encoded,
                 '-o', tmpfile,
                 '--stik', 'TV Show',
                 # set tags for TV shows
@@ -385,21 +609,36 @@ class Disc():
                 '--title',        multipart.name(episodes),
                 ]
             proc.check_call(cmdline)
-            os.chmod(
-                tmpfile,
-                os.stat(os.path.join(config.target, filename)).st_mode)
-            shutil.move(tmpfile, os.path.join(config.target, filename))
+            os.chmod(tmpfile, os.stat(encoded).st_mode)
+            shutil.move(tmpfile, output)
         finally:
             os.close(tmphandle)
+        size = os.path.getsize(output)
+        # Record the runtime and size of each episode; this history is used by
+        # automap to narrow the duration range on later discs of the same
+        # program, and to estimate the space required by later rips
+        if start_chapter:
+            duration = dt.timedelta(
+                milliseconds=end_chapter.finish_ms - start_chapter.start_ms)
+        else:
+            duration = title.duration
+        if config.remux:
+            preset = 'remux'
+        elif preset is None:
+            preset, threads = config.get_preset()
         for episode in episodes:
             episode.disc_id = title.disc.ident
             episode.disc_title = title.number
+            episode.duration = duration / len(episodes)
+            episode.size = size // len(episodes)
+            episode.preset = preset
             if start_chapter:
                 episode.start_chapter = start_chapter.number
                 episode.end_chapter = end_chapter.number
             else:
                 episode.start_chapter = None
                 episode.end_chapter = None
+        return output
 
 
 class Title():
@@ -415,20 +654,106 @@ class Title():
         self.aspect_ratio = 0
         self.frame_rate = 0
         self.crop = (0, 0, 0, 0)
+        self.vts = 0
+        self.ttn = 0
+        self.first_cell = 0
+        self.last_cell = 0
+        self.blocks = 0
+        self.index = len(disc.titles) - 1
         self.chapters = []
+        self._chapter_numbers = {}
+        self.chapter_durations = array('Q')
+        self.chapter_offsets = array('Q')
         self.audio_tracks = []
         self.subtitle_tracks = []
         self.interlaced = False
         self.duplicate = 'no'
+        self.contains = []
 
     def __repr__(self):
         return '<Title({})>'.format(self.number)
 
+    def build_timeline(self):
+        """
+        Builds the chapter timeline of the title.
+
+        This sorts the chapters by number and calculates the arrays of chapter
+        durations and start offsets (in integer milliseconds) from which
+        chapter positions are derived. It is called once the title has been
+        scanned and must be called again if chapters are altered.
+        """
+        self.chapters = sorted(self.chapters, key=attrgetter('number'))
+        self._chapter_numbers = {
+            chapter.number: chapter for chapter in reversed(self.chapters)}
+        self.chapter_durations = array('Q', (
+            chapter.duration // dt.timedelta(milliseconds=1)
+            for chapter in self.chapters
+            ))
+        self.chapter_offsets = array(
+            'Q', accumulate([0] + self.chapter_durations.tolist()[:-1]))
+        for index, chapter in enumerate(self.chapters):
+            chapter.index = index
+
+    @property
+    def chapters_ms(self):
+        "Returns the total duration of the title's chapters in milliseconds"
+        if self.chapters:
+            return self.chapter_offsets[-1] + self.chapter_durations[-1]
+        return 0
+
+    @property
+    def position(self):
+        """
+        Returns a key approximately ordering the title by its position on the
+        disc.
+
+        Title sets (VTS) are stored in order on the disc, and titles within a
+        set are usually (though not necessarily) stored in the order of their
+        title number (TTN). Cell numbers are only meaningful within a title's
+        program chain, so they merely order chapters within the title.
+        """
+        return (self.vts, self.ttn, self.first_cell)
+
+    @property
+    def signature(self):
+        """
+        Returns the content signature of the title.
+
+        This is a tuple of the duration (in milliseconds) and size (in blocks)
+        of each chapter. Titles with equal signatures (such as the duplicate
+        titles found on many discs) almost certainly have identical content.
+        """
+        if not self.chapters:
+            return ((self.duration // dt.timedelta(milliseconds=1),
+                     self.blocks),)
+        return tuple(zip(
+            self.chapter_durations,
+            (chapter.blocks for chapter in self.chapters)))
+
+    def disc_index(self):
+        "Returns the position of the title within the disc's titles"
+        titles = self.disc.titles
+        if not (self.index < len(titles) and titles[self.index] is self):
+            # The titles have been filtered or re-ordered since they were
+            # indexed; re-index them
+            self.disc.index_titles()
+            if not (self.index < len(titles) and titles[self.index] is self):
+                return None
+        return self.index
+
+    def get_chapter(self, number):
+        "Returns the chapter with the specified number or None"
+        chapter = self._chapter_numbers.get(number)
+        if chapter is None or chapter.title_index() is None:
+            self.build_timeline()
+            chapter = self._chapter_numbers.get(number)
+        return chapter
+
     @property
     def previous(self):
-        "Returns the prior chapter within the disc or None"
-        i = self.disc.titles.index(self)
-        if i == 0:
+        "Returns the prior title within the disc or None"
+        i = self.disc_index()
+        if not i:
             return None
         else:
             return self.disc.titles[i - 1]
@@ -436,8 +761,11 @@ class Title():
     @property
     def next(self):
         "Returns the next title within the disc or None"
+        i = self.disc_index()
+        if i is None:
+            return None
         try:
-            return self.disc.titles[self.disc.titles.index(self) + 1]
+            return self.disc.titles[i + 1]
         except IndexError:
             return None
 
@@ -451,32 +779,66 @@ class Chapter():
 
     def __init__(self, title):
         super().__init__()
+        self.index = len(title.chapters)
         title.chapters.append(self)
         self.title = proxy(title)
         self.number = 0
         self.duration = dt.timedelta(0)
+        self.first_cell = 0
+        self.last_cell = 0
+        self.blocks = 0
+
+    def title_index(self):
+        "Returns the position of the chapter within the title's chapters"
+        chapters = self.title.chapters
+        if not (self.index < len(chapters) and chapters[self.index] is self):
+            # The chapters have been altered since the timeline was built;
+            # rebuild it
+            self.title.build_timeline()
+            chapters = self.title.chapters
+            if not (self.index < len(chapters) and chapters[self.index] is self):
+                return None
+        return self.index
+
+    @property
+    def position(self):
+        "Returns a key approximately ordering the chapter by its disc position"
+        return (self.title.vts, self.title.ttn, self.first_cell)
+
+    @property
+    def start_ms(self):
+        "Returns the offset of the chapter within its title in milliseconds"
+        return self.title.chapter_offsets[self.title_index()]
+
+    @property
+    def duration_ms(self):
+        "Returns the duration of the chapter in milliseconds"
+        return self.title.chapter_durations[self.title_index()]
+
+    @property
+    def finish_ms(self):
+        "Returns the offset of the end of the chapter in milliseconds"
+        return self.start_ms + self.duration_ms
 
     @property
     def start(self):
         "Returns the start time of the chapter"
-        result = dt.datetime(dt.MINYEAR, 1, 1)
-        for chapter in self.title.chapters:
-            if chapter.number >= self.number:
-                break
-            result += chapter.duration
-        return result.time()
+        return (
+            dt.datetime(dt.MINYEAR, 1, 1) +
+            dt.timedelta(milliseconds=self.start_ms)).time()
 
     @property
     def finish(self):
         "Returns the finish time of the chapter"
-        result = dt.datetime.combine(dt.date(dt.MINYEAR, 1, 1), self.start)
-        return (result + self.duration).time()
+        return (
+            dt.datetime(dt.MINYEAR, 1, 1) +
+            dt.timedelta(milliseconds=self.finish_ms)).time()
 
     @property
     def previous(self):
         "Returns the prior chapter within the title or None"
-        i = self.title.chapters.index(self)
-        if i == 0:
+        i = self.title_index()
+        if not i:
             return None
         else:
             return self.title.chapters[i - 1]
@@ -484,8 +846,11 @@ class Chapter():
     @property
     def next(self):
         "Returns the next chapter within the title or None"
+        i = self.title_index()
+        if i is None:
+            return None
         try:
-            return self.title.chapters[self.title.chapters.index(self) + 1]
+            return self.title.chapters[i + 1]
         except IndexError:
             return None
 
@@ -80,15 +80,20 @@ else:
             get_handle_size(stdin)
         )
         if not result:
-            fd = os.open(os.ctermid(), os.O_RDONLY)
             try:
-                result = get_handle_size(fd)
-            finally:
-                os.close(fd)
+                fd = os.open(os.ctermid(), os.O_RDONLY)
+            except OSError:
+                # No controlling terminal (e.g. running under a daemon or CI)
+                pass
+            else:
+                try:
+                    result = get_handle_size(fd)
+                finally:
+                    os.close(fd)
         if not result:
             try:
-                result = (os.environ['COLUMNS'], os.environ['LINES'])
-            except KeyError:
+                result = (int(os.environ['COLUMNS']), int(os.environ['LINES']))
+            except (KeyError, ValueError):
                 # Default
                 result = (80, 24)
         return result